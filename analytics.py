@@ -0,0 +1,218 @@
+"""
+Weather-sensitivity analytics over the local usage cache
+
+Everything works on the memory-mapped NumPy columns from usage_cache, with no
+per-row Python: hourly cooling/heating degree-hours, a temperature-binned load
+curve, a least-squares fit of daily kWh against degree-days, and a
+weather-normalized monthly baseline. Results are stored next to the cache and
+reused until the cache watermark changes.
+"""
+import numpy as np
+import argparse
+import json
+import logging
+import os
+import time
+import srp_db
+import usage_cache
+
+# Degree-hour base temperature in °F (weather.py stores Fahrenheit)
+BALANCE_POINT_F = 65.0
+
+# Width of the load-curve temperature bins in °F
+BIN_WIDTH_F = 5.0
+
+# A day is used in the regression only with at least this many hours of usage and temperature (23 on DST days)
+MIN_DAY_HOURS = 23
+
+RESULTS_FILE = 'analytics.json'
+
+
+def degree_hours(temperature, base=BALANCE_POINT_F):
+    """Return (cooling, heating) degree-hours for each hourly temperature; NaN stays NaN"""
+    return np.maximum(temperature - base, 0), np.maximum(base - temperature, 0)
+
+
+def daily_totals(datetimes, kwh, temperature, base=BALANCE_POINT_F):
+    """
+    Aggregate hourly columns to days
+    Returns a dict of equal-length arrays: day, kwh, cdd, hdd, usage_hours, weather_hours
+    Degree-days are the mean degree-hours over the hours that have a temperature
+    """
+    days, index = np.unique(datetimes.astype('datetime64[D]'), return_inverse=True)
+    has_kwh = ~np.isnan(kwh)
+    has_temp = ~np.isnan(temperature)
+    cooling, heating = degree_hours(temperature, base)
+
+    usage_hours = np.bincount(index, weights=has_kwh, minlength=len(days))
+    weather_hours = np.bincount(index, weights=has_temp, minlength=len(days))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdd = np.bincount(index, weights=np.where(has_temp, cooling, 0), minlength=len(days)) / weather_hours
+        hdd = np.bincount(index, weights=np.where(has_temp, heating, 0), minlength=len(days)) / weather_hours
+    return {
+        'day': days,
+        'kwh': np.bincount(index, weights=np.where(has_kwh, kwh, 0), minlength=len(days)),
+        'cdd': cdd,
+        'hdd': hdd,
+        'usage_hours': usage_hours,
+        'weather_hours': weather_hours,
+    }
+
+
+def load_curve(temperature, kwh, bin_width=BIN_WIDTH_F):
+    """Mean, standard deviation and count of hourly kWh in each temperature bin (labelled by its lower edge)"""
+    valid = ~(np.isnan(temperature) | np.isnan(kwh))
+    bins = np.floor(temperature[valid] / bin_width).astype(np.int64)
+    values = kwh[valid]
+    edges, index = np.unique(bins, return_inverse=True)
+    count = np.bincount(index, minlength=len(edges))
+    mean = np.bincount(index, weights=values, minlength=len(edges)) / count
+    square = np.bincount(index, weights=values * values, minlength=len(edges)) / count
+    return {
+        'temperature': edges * bin_width,
+        'mean_kwh': mean,
+        'std_kwh': np.sqrt(np.maximum(square - mean * mean, 0)),
+        'hours': count,
+    }
+
+
+def fit_degree_days(daily, min_hours=MIN_DAY_HOURS):
+    """
+    Least-squares fit of daily kWh = base + cooling * CDD + heating * HDD over complete days
+    Returns {'base', 'cooling', 'heating', 'r2', 'days'}
+    """
+    complete = (daily['usage_hours'] >= min_hours) & (daily['weather_hours'] >= min_hours)
+    y = daily['kwh'][complete]
+    if len(y) < 3:
+        return {'base': None, 'cooling': None, 'heating': None, 'r2': None, 'days': int(len(y))}
+    x = np.column_stack([np.ones(len(y)), daily['cdd'][complete], daily['hdd'][complete]])
+    coef, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+    residual = y - x @ coef
+    total = ((y - y.mean()) ** 2).sum()
+    return {
+        'base': float(coef[0]),
+        'cooling': float(coef[1]),
+        'heating': float(coef[2]),
+        'r2': float(1 - (residual ** 2).sum() / total) if total else None,
+        'days': int(len(y)),
+    }
+
+
+def normalized_baseline(daily, model, min_hours=MIN_DAY_HOURS):
+    """
+    Weather-normalized mean daily kWh per year-month
+    Each day's kWh is adjusted from its actual degree-days to the normal degree-days
+    for its calendar day, the mean over every year in the data
+    """
+    complete = (daily['usage_hours'] >= min_hours) & (daily['weather_hours'] >= min_hours)
+    days = daily['day'][complete]
+    if model['base'] is None or not len(days):
+        return {'month': np.array([], dtype='datetime64[M]'), 'actual_kwh': np.array([]),
+                'normalized_kwh': np.array([]), 'days': np.array([], dtype=np.int64)}
+
+    # Day of year 0-365, shifting non-leap years past Feb 29 so calendar dates line up
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    day_of_year = (days - years).astype(np.int64)
+    leap = (years.astype(np.int64) + 1970) % 4 == 0
+    day_of_year = np.where(~leap & (day_of_year >= 59), day_of_year + 1, day_of_year)
+
+    cdd, hdd = daily['cdd'][complete], daily['hdd'][complete]
+    counts = np.bincount(day_of_year, minlength=366)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normal_cdd = (np.bincount(day_of_year, weights=cdd, minlength=366) / counts)[day_of_year]
+        normal_hdd = (np.bincount(day_of_year, weights=hdd, minlength=366) / counts)[day_of_year]
+    normalized = (daily['kwh'][complete]
+                  + model['cooling'] * (normal_cdd - cdd)
+                  + model['heating'] * (normal_hdd - hdd))
+
+    month_keys, index = np.unique(months, return_inverse=True)
+    month_days = np.bincount(index)
+    return {
+        'month': month_keys,
+        'actual_kwh': np.bincount(index, weights=daily['kwh'][complete]) / month_days,
+        'normalized_kwh': np.bincount(index, weights=normalized) / month_days,
+        'days': month_days,
+    }
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.datetime64):
+            return [str(item) for item in value]
+        return [None if np.isnan(item) else item for item in value.astype(float).tolist()]
+    return value
+
+
+def analyze(cache_dir=usage_cache.CACHE_DIR, base=BALANCE_POINT_F, bin_width=BIN_WIDTH_F, use_results=True):
+    """
+    Run every analysis over the cached columns
+    With use_results, return the stored results when the cache watermark and parameters are unchanged
+    """
+    meta = usage_cache.load_meta(cache_dir)
+    key = {'account': meta.get('account'), 'rows': meta['rows'], 'updated_at': meta['updated_at'],
+           'max_id': meta['max_id'], 'base': base, 'bin_width': bin_width}
+    path = os.path.join(cache_dir, RESULTS_FILE)
+    if use_results and os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored.get('key') == key:
+            return stored['results']
+
+    arrays = usage_cache.load_arrays(cache_dir)
+    temperature = arrays['temperature'].astype(np.float64)
+    kwh = arrays['kwh']
+    cooling, heating = degree_hours(temperature, base)
+    daily = daily_totals(arrays['datetime'], kwh, temperature, base)
+    model = fit_degree_days(daily)
+    results = _jsonable({
+        'degree_hours': {'cooling': float(np.nansum(cooling)), 'heating': float(np.nansum(heating))},
+        'load_curve': load_curve(temperature, kwh, bin_width),
+        'model': model,
+        'baseline': normalized_baseline(daily, model),
+    })
+
+    if os.path.isdir(cache_dir):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'key': key, 'results': results}, f)
+        os.replace(path + '.tmp', path)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather-sensitivity analysis of cached hourly usage")
+    parser.add_argument('--sync', action='store_true', help="Sync the usage cache from MySQL first")
+    parser.add_argument('--base', type=float, default=BALANCE_POINT_F, help="Degree-hour base temperature in °F")
+    parser.add_argument('--bin-width', type=float, default=BIN_WIDTH_F, help="Load curve bin width in °F")
+    parser.add_argument('--recompute', action='store_true', help="Ignore stored results")
+    parser.add_argument('--cache-dir', default=usage_cache.CACHE_DIR, help="Usage cache directory")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    if args.sync:
+        with srp_db.connection() as conn:
+            usage_cache.sync(conn, args.cache_dir)
+
+    started = time.perf_counter()
+    results = analyze(args.cache_dir, args.base, args.bin_width, use_results=not args.recompute)
+    logging.info(f"Analysis finished in {time.perf_counter() - started:.3f}s")
+
+    model = results['model']
+    print(f"Cooling degree-hours: {results['degree_hours']['cooling']:.0f}, "
+          f"heating degree-hours: {results['degree_hours']['heating']:.0f} (base {args.base}°F)")
+    if model['base'] is not None:
+        print(f"Daily kWh = {model['base']:.2f} + {model['cooling']:.3f} x CDD + {model['heating']:.3f} x HDD "
+              f"(R² {model['r2']:.3f}, {model['days']} days)")
+    print("\nLoad curve (°F: mean kWh/hour, hours)")
+    curve = results['load_curve']
+    for temp, mean, hours in zip(curve['temperature'], curve['mean_kwh'], curve['hours']):
+        print(f"  {temp:5.0f}-{temp + args.bin_width:<5.0f} {mean:6.3f}  {hours:.0f}")
+    print("\nWeather-normalized baseline (month: actual, normalized kWh/day)")
+    baseline = results['baseline']
+    for month, actual, normalized in zip(baseline['month'], baseline['actual_kwh'], baseline['normalized_kwh']):
+        print(f"  {month}  {actual:7.2f}  {normalized:7.2f}")
@@ -1,10 +1,21 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from srpenergy.client import SrpEnergyClient
-import MySQLdb
 import pandas as pd
+import argparse
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
+from srp_collect import SRP_MAX_WINDOW_DAYS
+from backfill_journal import BackfillJournal, COMPLETED, EMPTY, FAILED, journal_path
+import metrics
+import hour_coverage
+import srp_db
+from srp_writer import WRITE_BATCH_SIZE, parse_usage_row
+import storage
+import usage_cache
 
 # Configure logging
 logging.basicConfig(
@@ -18,58 +29,103 @@ logging.basicConfig(
 
 load_dotenv()
 
+# Default sustained SRP request rate (requests/sec) across all workers
+SRP_REQUEST_RATE = 1.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all workers to cap the SRP request rate"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def count_range_hours(ranges):
+    """Total number of hours covered by inclusive (start, end) hour ranges"""
+    return sum(int((end - start).total_seconds() // 3600) + 1 for start, end in ranges)
+
+
+def split_ranges_by_date(ranges):
+    """Split inclusive (start, end) hour ranges into {date: [hours]} for the days they touch"""
+    hours_by_date = {}
+    for start, end in ranges:
+        current = start
+        while current <= end:
+            day_end = min(end, datetime.combine(current.date(), datetime.min.time()) + timedelta(hours=23))
+            hours_by_date.setdefault(current.date(), []).extend(range(current.hour, day_end.hour + 1))
+            current = day_end + timedelta(hours=1)
+    return hours_by_date
+
+
+def plan_fetch_windows(missing_ranges, max_days=SRP_MAX_WINDOW_DAYS, skip_dates=None):
+    """
+    Merge the days touched by missing hour ranges into consecutive multi-day
+    fetch windows of at most max_days each, leaving out any skip_dates
+    Returns a list of {'start', 'end', 'days', 'hours'} dicts where 'hours' is
+    the set of missing hour datetimes the window should fill
+    """
+    missing_by_date = split_ranges_by_date(missing_ranges)
+    
+    windows = []
+    current = None
+    for date_obj in sorted(missing_by_date):
+        if skip_dates and date_obj in skip_dates:
+            continue
+        day_start = datetime.combine(date_obj, datetime.min.time())
+        if (current is None
+                or date_obj != current['last_date'] + timedelta(days=1)
+                or current['days'] >= max_days):
+            current = {'start': day_start, 'last_date': date_obj, 'days': 0, 'hours': set()}
+            windows.append(current)
+        current['last_date'] = date_obj
+        current['days'] += 1
+        current['hours'].update(day_start + timedelta(hours=hour) for hour in missing_by_date[date_obj])
+    
+    for window in windows:
+        window['end'] = datetime.combine(window.pop('last_date'), datetime.min.time()) + timedelta(days=1)
+        window['dates'] = [window['start'].date() + timedelta(days=i) for i in range(window['days'])]
+    return windows
+
 class SrpDataManager:
-    def __init__(self):
-        self.db_connection = None
-        self.cursor = None
-        self.setup_database()
+    def __init__(self, account=None, storage=None):
+        """Use the given storage backend, or open the configured one (SRP_STORAGE)"""
+        self.account = srp_db.DEFAULT_ACCOUNT if account is None else account
+        self.storage = storage
+        self.srp_clients = threading.local()
+        self.stats_lock = threading.Lock()
+        if self.storage is None:
+            self.setup_database()
         
     def setup_database(self):
-        """Initialize database connection"""
+        """Open the configured storage backend (SRP_STORAGE)"""
         try:
-            self.db_connection = MySQLdb.Connection(
-                host=os.getenv('BI_HOST'),
-                user=os.getenv('BI_USER'),
-                password=os.getenv('BI_PASS'),
-                port=3306,
-                db=os.getenv('GEN_DB_NAME')
-            )
-            self.cursor = self.db_connection.cursor()
-            logging.info("Database connection established")
+            self.storage = storage.open_storage()
+            logging.info(f"Storage opened ({type(self.storage).__name__})")
         except Exception as e:
             logging.error(f"Database connection failed: {e}")
             raise
     
-    def get_existing_datetime_records(self):
-        """Query database to get all existing date/time combinations"""
-        try:
-            self.cursor.execute("""
-                SELECT DISTINCT DATE(datetime) as date, HOUR(datetime) as hour, datetime
-                FROM srp 
-                ORDER BY datetime
-            """)
-            results = self.cursor.fetchall()
-            
-            existing_combos = set()
-            for date, hour, full_datetime in results:
-                date_str = date.strftime('%Y-%m-%d')
-                existing_combos.add(f"{date_str}-{hour:02d}")
-            
-            logging.info(f"Found {len(existing_combos)} existing date/hour combinations")
-            return existing_combos, results
-            
-        except Exception as e:
-            logging.error(f"Error querying existing records: {e}")
-            return set(), []
-    
     def get_date_range_from_db(self):
         """Get the full date range from existing data"""
         try:
-            self.cursor.execute("""
-                SELECT MIN(DATE(datetime)) as min_date, MAX(DATE(datetime)) as max_date
-                FROM srp
-            """)
-            result = self.cursor.fetchone()
+            result = self.storage.date_range(self.account)
             
             if result and result[0] and result[1]:
                 return result[0], result[1]
@@ -81,13 +137,26 @@ class SrpDataManager:
             logging.error(f"Error getting date range: {e}")
             return datetime.now().date() - timedelta(days=30), datetime.now().date()
     
-    def find_missing_datetime_combinations(self, start_date=None, end_date=None):
-        """Find all missing date/hour combinations in the specified range"""
+    def get_date_range(self, use_coverage=False):
+        """Get the full date range from the coverage index when asked and populated, else from storage"""
+        if use_coverage:
+            first, last = hour_coverage.bounds(hour_coverage.account_dir(self.account))
+            if first and last:
+                return first, last
+        return self.get_date_range_from_db()
+    
+    def find_missing_ranges(self, start_date=None, end_date=None, use_cache=False, use_coverage=False):
+        """
+        Find missing hours inside the database and return them as compressed ranges
+        With use_cache, sync the local columnar cache (MySQL only) and compute them from it instead
+        With use_coverage, read them from the hour-coverage bitmap without touching the database
+        Returns a list of inclusive (gap_start, gap_end) hour datetimes
+        """
         
         if not start_date or not end_date:
-            start_date, end_date = self.get_date_range_from_db()
+            start_date, end_date = self.get_date_range(use_coverage)
         
-        # Convert to datetime objects if they're date objects
+        # Convert to date objects if they're datetime objects
         if hasattr(start_date, 'date'):
             start_date = start_date.date()
         if hasattr(end_date, 'date'):
@@ -95,60 +164,56 @@ class SrpDataManager:
             
         logging.info(f"Checking for missing data between {start_date} and {end_date}")
         
-        existing_combos, _ = self.get_existing_datetime_records()
+        if use_coverage:
+            missing_ranges = hour_coverage.missing_ranges(start_date, end_date, hour_coverage.account_dir(self.account))
+            logging.info(f"Found {count_range_hours(missing_ranges)} missing hours in {len(missing_ranges)} ranges (coverage index)")
+            return missing_ranges
         
-        missing_combinations = []
-        current_date = start_date
+        if use_cache:
+            if not isinstance(self.storage, storage.MySQLStorage):
+                raise ValueError("The usage cache syncs from MySQL; use --coverage with the SQLite backend")
+            usage_cache.sync(self.storage.conn, account=self.account)
+            datetimes = usage_cache.load_arrays()['datetime']
+            missing_ranges = usage_cache.find_missing_ranges(datetimes, start_date, end_date)
+            logging.info(f"Found {count_range_hours(missing_ranges)} missing hours in {len(missing_ranges)} ranges (cache)")
+            return missing_ranges
         
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            
-            for hour in range(24):
-                combo_key = f"{date_str}-{hour:02d}"
-                
-                if combo_key not in existing_combos:
-                    missing_dt = datetime.combine(current_date, datetime.min.time()) + timedelta(hours=hour)
-                    missing_combinations.append({
-                        'date': current_date,
-                        'hour': hour,
-                        'datetime': missing_dt,
-                        'date_str': date_str,
-                        'combo_key': combo_key
-                    })
-            
-            current_date += timedelta(days=1)
+        try:
+            missing_ranges = self.storage.find_missing_ranges(start_date, end_date, self.account)
+        except Exception as e:
+            logging.error(f"Error querying missing ranges: {e}")
+            return []
         
-        logging.info(f"Found {len(missing_combinations)} missing date/hour combinations")
-        return missing_combinations
+        logging.info(f"Found {count_range_hours(missing_ranges)} missing hours in {len(missing_ranges)} ranges")
+        return missing_ranges
     
-    def analyze_data_gaps(self, start_date=None, end_date=None):
+    def analyze_data_gaps(self, start_date=None, end_date=None, use_cache=False, use_coverage=False):
         """Analyze and report on data gaps"""
-        missing_combos = self.find_missing_datetime_combinations(start_date, end_date)
+        if not start_date or not end_date:
+            start_date, end_date = self.get_date_range(use_coverage)
+        if hasattr(start_date, 'date'):
+            start_date = start_date.date()
+        if hasattr(end_date, 'date'):
+            end_date = end_date.date()
+        
+        missing_ranges = self.find_missing_ranges(start_date, end_date, use_cache, use_coverage)
         
-        if not missing_combos:
+        if not missing_ranges:
             logging.info("No missing data found - database is complete!")
             return
         
-        # Group by date to analyze patterns
-        missing_by_date = {}
-        for combo in missing_combos:
-            date_str = combo['date_str']
-            if date_str not in missing_by_date:
-                missing_by_date[date_str] = []
-            missing_by_date[date_str].append(combo['hour'])
+        missing_by_date = split_ranges_by_date(missing_ranges)
         
-        complete_days = 0
         partial_days = []
         missing_days = []
         
-        for date_str, missing_hours in missing_by_date.items():
+        for date_obj, missing_hours in missing_by_date.items():
             if len(missing_hours) == 24:
-                missing_days.append(date_str)
+                missing_days.append(date_obj.strftime('%Y-%m-%d'))
             else:
-                partial_days.append({'date': date_str, 'missing_hours': sorted(missing_hours)})
+                partial_days.append({'date': date_obj.strftime('%Y-%m-%d'), 'missing_hours': missing_hours})
         
         # Count complete days
-        start_date, end_date = self.get_date_range_from_db()
         total_days = (end_date - start_date).days + 1
         days_with_gaps = len(missing_by_date)
         complete_days = total_days - days_with_gaps
@@ -163,7 +228,8 @@ class SrpDataManager:
         print(f"Days with missing data: {days_with_gaps}")
         print(f"Completely missing days: {len(missing_days)}")
         print(f"Partially missing days: {len(partial_days)}")
-        print(f"Total missing records: {len(missing_combos)}")
+        print(f"Total missing records: {count_range_hours(missing_ranges)}")
+        print(f"Missing ranges: {len(missing_ranges)}")
         
         if missing_days:
             print(f"\nCompletely missing days ({len(missing_days)}):")
@@ -181,7 +247,7 @@ class SrpDataManager:
             if len(partial_days) > 10:
                 print(f"  ... and {len(partial_days) - 10} more")
         
-        return missing_combos
+        return missing_ranges
     
     def _compress_hour_ranges(self, hours):
         """Convert list of hours to compressed ranges (e.g., [0,1,2,5,6] -> '0-2, 5-6')"""
@@ -205,135 +271,230 @@ class SrpDataManager:
         
         return ', '.join(ranges)
     
-    def fetch_missing_data(self, missing_combinations, batch_size=24):
-        """Fetch missing data from SRP API and insert into database"""
+    def get_srp_client(self):
+        """Return the calling worker's SRP client, creating it on first use"""
+        client = getattr(self.srp_clients, 'client', None)
+        if client is None:
+            client = SrpEnergyClient(
+                self.account,
+                os.getenv('SRP_USER'),
+                os.getenv('SRP_PASS')
+            )
+            self.srp_clients.client = client
+        return client
+    
+    def _fetch_window(self, window, limiter, worker_stats):
+        """
+        Fetch one window from SRP on a worker thread
+        Returns the raw usage, the parsed rows for missing hours, and the days SRP returned data for
+        """
+        if limiter:
+            limiter.acquire()
+        
+        started = time.monotonic()
+        # SRP treats both bounds as inclusive dates, so ask for the window's last day
+        last_day = window['end'] - timedelta(days=1)
+        with metrics.timer('srp_usage', first_day=window['start'].date(), last_day=last_day.date()):
+            usage = self.get_srp_client().usage(window['start'], min(last_day, datetime.now()))
+        metrics.incr('rows_fetched', len(usage or []))
+        
+        records = []
+        returned_days = set()
+        for row in usage or []:
+            record = parse_usage_row(row)
+            returned_days.add(record[0])
+            
+            # Keep only the hours that were missing
+            if record[-1].replace(minute=0, second=0) in window['hours']:
+                records.append(record)
+        
+        elapsed = time.monotonic() - started
+        with self.stats_lock:
+            stats = worker_stats.setdefault(threading.current_thread().name, {'requests': 0, 'rows': 0, 'seconds': 0.0})
+            stats['requests'] += 1
+            stats['rows'] += len(records)
+            stats['seconds'] += elapsed
+        
+        return usage, records, returned_days
+    
+    def _record_window(self, journal, window, records, returned_days):
+        """
+        Journal a written window day by day: completed only when every missing hour of the day was written,
+        failed (retried later) when SRP returned the day but not all of them, empty when it returned nothing
+        """
+        written_hours = {record[-1].replace(minute=0, second=0) for record in records}
+        missing_by_day = {}
+        for hour in window['hours']:
+            missing_by_day.setdefault(hour.date(), set()).add(hour)
+        
+        rows_by_day = {}
+        for record in records:
+            rows_by_day[record[0]] = rows_by_day.get(record[0], 0) + 1
+        
+        completed, partial = [], []
+        for day in window['dates']:
+            if day not in returned_days:
+                continue
+            unwritten = missing_by_day.get(day, set()) - written_hours
+            (partial if unwritten else completed).append(day)
         
-        if not missing_combinations:
+        journal.record(completed, COMPLETED, rows_by_day)
+        journal.record(partial, FAILED, rows_by_day, error="SRP returned only part of the missing hours")
+        journal.record([day for day in window['dates'] if day not in returned_days], EMPTY)
+    
+    def fetch_missing_data(self, missing_ranges, max_days=SRP_MAX_WINDOW_DAYS, workers=1, rate=None,
+                           batch_size=WRITE_BATCH_SIZE, journal=None):
+        """
+        Fetch missing (gap_start, gap_end) hour ranges from SRP API and insert into database
+        Windows are fetched on up to `workers` threads, limited to `rate` requests/sec
+        overall, and written to storage in order by the calling thread
+        With a journal, days it already finished, found empty on several runs or
+        gave up on are skipped, and every window's outcome is recorded as soon as it is committed
+        """
+        
+        if not missing_ranges:
             logging.info("No missing data to fetch")
             return
         
-        accountid = os.getenv('SRP_ACCOUNT')
-        username = os.getenv('SRP_USER')
-        password = os.getenv('SRP_PASS')
+        skip_dates = journal.skip_dates() if journal else None
         
-        # Group missing combinations by date for efficient API calls
-        missing_by_date = {}
-        for combo in missing_combinations:
-            date_key = combo['date_str']
-            if date_key not in missing_by_date:
-                missing_by_date[date_key] = []
-            missing_by_date[date_key].append(combo)
+        # Coalesce consecutive missing days into as few API calls as possible
+        windows = plan_fetch_windows(missing_ranges, max_days, skip_dates)
+        if skip_dates:
+            logging.info(f"Skipping {len(skip_dates)} days already completed, repeatedly empty or out of retries")
+        limiter = TokenBucket(rate) if rate else None
+        worker_stats = {}
         
-        total_dates = len(missing_by_date)
+        total_windows = len(windows)
         successful_fetches = 0
         failed_fetches = 0
+        started = time.monotonic()
         
-        for i, (date_str, date_combos) in enumerate(sorted(missing_by_date.items())):
-            try:
-                logging.info(f"Processing {date_str} ({i+1}/{total_dates}) - {len(date_combos)} missing hours")
-                
-                # Convert date string back to date object
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                start_date = datetime.combine(date_obj, datetime.min.time())
-                end_date = start_date + timedelta(days=1)
-                
-                # Fetch data from SRP API
-                client = SrpEnergyClient(accountid, username, password)
-                usage = client.usage(start_date, end_date)
-                
-                if not usage:
-                    logging.warning(f"No data returned for {date_str}")
-                    failed_fetches += 1
-                    continue
-                
-                # Insert data into database
-                records_inserted = 0
-                for row in usage:
-                    date_val, hour_val, isodate_val, kwh_val, cost_val = row
+        logging.info(f"Planned {total_windows} SRP requests for {count_range_hours(missing_ranges)} missing hours "
+                     f"using {workers} worker(s)")
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='srp-fetch') as executor:
+            futures = [executor.submit(self._fetch_window, window, limiter, worker_stats) for window in windows]
+            
+            # Single writer: results are committed in window order as they complete
+            for i, (window, future) in enumerate(zip(windows, futures)):
+                label = f"{window['start'].date()} to {(window['end'] - timedelta(days=1)).date()}"
+                try:
+                    logging.info(f"Processing {label} ({i+1}/{total_windows}) - {len(window['hours'])} missing hours")
+                    usage, records, returned_days = future.result()
                     
-                    # Parse the ISO date to get a proper datetime object
-                    format_time = datetime.strptime(isodate_val, '%Y-%m-%dT%H:%M:%S')
+                    if not usage:
+                        logging.warning(f"No data returned for {label}")
+                        metrics.incr('windows_empty')
+                        if journal:
+                            journal.record(window['dates'], EMPTY)
+                        failed_fetches += 1
+                        continue
                     
-                    # Check if this specific hour was missing
-                    hour_num = format_time.hour
-                    combo_key = f"{date_str}-{hour_num:02d}"
+                    self.storage.upsert_usage(records, batch_size, account=self.account)
+                    logging.info(f"Inserted {len(records)} records for {label}")
+                    successful_fetches += 1
                     
-                    missing_hours = [combo['hour'] for combo in date_combos]
-                    if hour_num in missing_hours:
-                        record_data = [
-                            date_val,
-                            hour_val, 
-                            isodate_val,
-                            kwh_val,
-                            cost_val,
-                            format_time
-                        ]
-                        
-                        self.cursor.execute(
-                            'INSERT INTO srp(date, hour, isotime, kwh, cost, datetime) VALUES(%s, %s, %s, %s, %s, %s)',
-                            record_data
-                        )
-                        records_inserted += 1
-                
-                self.db_connection.commit()
-                logging.info(f"Inserted {records_inserted} records for {date_str}")
-                successful_fetches += 1
-                
-            except Exception as e:
-                logging.error(f"Error processing {date_str}: {e}")
-                failed_fetches += 1
-                continue
+                    if journal:
+                        self._record_window(journal, window, records, returned_days)
+                    
+                except Exception as e:
+                    logging.error(f"Error processing {label}: {e}")
+                    metrics.incr('windows_failed')
+                    if journal:
+                        journal.record(window['dates'], FAILED, error=str(e))
+                    failed_fetches += 1
+                    continue
         
-        logging.info(f"Data fetching complete: {successful_fetches} successful, {failed_fetches} failed")
+        elapsed = time.monotonic() - started
+        logging.info(f"Data fetching complete: {successful_fetches} successful, {failed_fetches} failed in {elapsed:.1f}s")
+        for name, stats in sorted(worker_stats.items()):
+            rate_str = f"{stats['rows'] / stats['seconds']:.0f} rows/sec" if stats['seconds'] > 0 else "n/a"
+            logging.info(f"  {name}: {stats['requests']} requests, {stats['rows']} rows, "
+                         f"{stats['seconds']:.1f}s fetching ({rate_str})")
     
-    def run_complete_gap_analysis_and_fill(self, start_date=None, end_date=None, fill_gaps=False):
+    def run_complete_gap_analysis_and_fill(self, start_date=None, end_date=None, fill_gaps=False,
+                                           assume_yes=False, workers=1, rate=None, use_cache=False,
+                                           journal=None, use_coverage=False):
         """Complete workflow: analyze gaps and optionally fill them"""
         
         print("Starting comprehensive data gap analysis...")
         
         # Step 1: Analyze current gaps
-        missing_combos = self.analyze_data_gaps(start_date, end_date)
+        missing_ranges = self.analyze_data_gaps(start_date, end_date, use_cache, use_coverage)
         
-        if not missing_combos:
+        if not missing_ranges:
             return
         
         # Step 2: Optionally fill gaps
         if fill_gaps:
-            response = input(f"\nFound {len(missing_combos)} missing records. Fetch from SRP API? (y/n): ")
+            if assume_yes:
+                response = 'y'
+            else:
+                response = input(f"\nFound {count_range_hours(missing_ranges)} missing records. Fetch from SRP API? (y/n): ")
             if response.lower() == 'y':
                 print("Fetching missing data from SRP API...")
-                self.fetch_missing_data(missing_combos)
+                self.fetch_missing_data(missing_ranges, workers=workers, rate=rate, journal=journal)
                 print("Gap filling complete!")
             else:
                 print("Skipping data fetch.")
         else:
-            print(f"\nTo fill these gaps, run with fill_gaps=True")
+            print(f"\nTo fill these gaps, run with --fill (or fill_gaps=True)")
             print("Or call fetch_missing_data() manually")
     
     def close_connection(self):
-        """Close database connection"""
-        if self.cursor:
-            self.cursor.close()
-        if self.db_connection:
-            self.db_connection.close()
+        """Return the database connection to the pool"""
+        if self.storage:
+            self.storage.close()
         logging.info("Database connection closed")
 
 
-# Example usage
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze and optionally fill gaps in SRP hourly usage data")
+    parser.add_argument('--account', default=srp_db.DEFAULT_ACCOUNT,
+                        help="SRP account to analyze and fill (default SRP_ACCOUNT); SRP_USER must have access to it")
+    parser.add_argument('--start', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help="First date to analyze (YYYY-MM-DD); defaults to the oldest record")
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help="Last date to analyze (YYYY-MM-DD); defaults to the newest record")
+    parser.add_argument('--cache', action='store_true',
+                        help="Sync the local columnar cache and find gaps from it instead of querying MySQL")
+    parser.add_argument('--coverage', action='store_true',
+                        help="Find gaps from the hour-coverage bitmap (see hour_coverage.py) instead of querying the database")
+    parser.add_argument('--fill', action='store_true', help="Fetch missing data from the SRP API")
+    parser.add_argument('--yes', action='store_true', help="Do not prompt before fetching")
+    parser.add_argument('--workers', type=int, default=1, help="Number of concurrent SRP fetch workers")
+    parser.add_argument('--rate', type=float, default=SRP_REQUEST_RATE,
+                        help="Maximum SRP requests per second across all workers")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="Ignore the checkpoint journal and fetch every missing day")
+    parser.add_argument('--reset-journal', action='store_true',
+                        help="Forget recorded progress, including known-empty days, before running")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    manager = SrpDataManager()
+    args = parse_args()
+    manager = SrpDataManager(args.account)
+    journal = None if args.no_journal else BackfillJournal(journal_path(args.account))
+    if journal and args.reset_journal:
+        journal.reset()
     
     try:
-        # Option 1: Just analyze gaps without filling
-        manager.run_complete_gap_analysis_and_fill(fill_gaps=False)
-        
-        # Option 2: Analyze and fill gaps (uncomment to use)
-        # manager.run_complete_gap_analysis_and_fill(fill_gaps=True)
-        
-        # Option 3: Analyze specific date range
-        # start = datetime(2025, 3, 1).date()
-        # end = datetime(2025, 5, 31).date()
-        # manager.run_complete_gap_analysis_and_fill(start, end, fill_gaps=True)
-        
+        with metrics.timer('backfill_total'):
+            manager.run_complete_gap_analysis_and_fill(
+                args.start, args.end,
+                fill_gaps=args.fill,
+                assume_yes=args.yes,
+                workers=args.workers,
+                rate=args.rate,
+                use_cache=args.cache,
+                journal=journal,
+                use_coverage=args.coverage
+            )
     finally:
         manager.close_connection()
+        if journal:
+            logging.info(f"Backfill journal: {journal.summary()}")
+            journal.close()
+        metrics.flush('backfill')
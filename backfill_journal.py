@@ -0,0 +1,102 @@
+from datetime import datetime
+import logging
+import os
+import sqlite3
+from dotenv import load_dotenv
+import srp_db
+
+load_dotenv()
+
+# Local SQLite journal of backfill progress, one row per day
+JOURNAL_PATH = os.getenv('SRP_BACKFILL_JOURNAL', '.backfill_journal.sqlite')
+
+# Failed days are retried on later runs until they have failed this many times
+MAX_ATTEMPTS = 5
+
+# A day is only treated as having no data once SRP has returned nothing for it
+# on this many runs in a row; one empty answer may just be an outage or publishing lag
+EMPTY_RUNS = 3
+
+COMPLETED = 'completed'
+EMPTY = 'empty'
+FAILED = 'failed'
+
+
+def journal_path(account=None):
+    """Journal file of an account; SRP_ACCOUNT keeps JOURNAL_PATH so existing progress carries over"""
+    if account is None or account == srp_db.DEFAULT_ACCOUNT:
+        return JOURNAL_PATH
+    root, ext = os.path.splitext(JOURNAL_PATH)
+    return f"{root}.{account}{ext}"
+
+
+class BackfillJournal:
+    """Crash-safe record of which days a backfill has completed, found empty or failed"""
+
+    def __init__(self, path=JOURNAL_PATH, max_attempts=MAX_ATTEMPTS, empty_runs=EMPTY_RUNS):
+        self.max_attempts = max_attempts
+        self.empty_runs = empty_runs
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_days (
+                day TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                rows_written INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at TEXT NOT NULL,
+                empty_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Journals written before empty_count existed start every empty day at 0, so it is retried
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(backfill_days)")}
+        if 'empty_count' not in columns:
+            self.conn.execute("ALTER TABLE backfill_days ADD COLUMN empty_count INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+    def skip_dates(self):
+        """
+        Days a restarted backfill should not fetch again: completed, empty on EMPTY_RUNS runs in a row,
+        or out of retries
+        """
+        cursor = self.conn.execute(
+            "SELECT day FROM backfill_days WHERE status = ? OR (status = ? AND empty_count >= ?) OR attempts >= ?",
+            (COMPLETED, EMPTY, self.empty_runs, self.max_attempts)
+        )
+        return {datetime.strptime(day, '%Y-%m-%d').date() for (day,) in cursor}
+
+    def record(self, days, status, rows_by_day=None, error=None):
+        """
+        Record the outcome for each day of a window in one transaction
+        EMPTY extends a day's run of empty answers; any other outcome ends it
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        rows_by_day = rows_by_day or {}
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO backfill_days (day, status, attempts, rows_written, last_error, updated_at, empty_count)
+                VALUES (?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = attempts + 1,
+                    rows_written = rows_written + excluded.rows_written,
+                    last_error = excluded.last_error,
+                    updated_at = excluded.updated_at,
+                    empty_count = CASE WHEN excluded.status = ? THEN empty_count + 1 ELSE 0 END
+            """, [(day.strftime('%Y-%m-%d'), status, rows_by_day.get(day, 0), error, now, int(status == EMPTY), EMPTY)
+                  for day in days])
+
+    def summary(self):
+        """Return {status: day count}"""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM backfill_days GROUP BY status").fetchall())
+
+    def reset(self):
+        """Forget all recorded progress"""
+        with self.conn:
+            self.conn.execute("DELETE FROM backfill_days")
+        logging.info("Backfill journal cleared")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,294 @@
+"""
+Offline benchmark for the collection pipeline
+
+Runs collector and backfill insert throughput, gap analysis and weather enrichment against
+synthetic data at several history lengths, with no SRP account, network or
+MySQL server: a fake SrpEnergyClient generates hourly usage, a stub replaces
+the Open-Meteo client and rows go through the in-memory SQLite storage backend.
+Results are written as JSON and compared with the previous run's file.
+"""
+from datetime import date, datetime, timedelta
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+# Keep the tile store and coverage index away from the real ones; must be set before import
+_bench_dir = tempfile.mkdtemp(prefix='srp-bench-')
+atexit.register(shutil.rmtree, _bench_dir, ignore_errors=True)
+os.environ.setdefault('SRP_WEATHER_TILE_DIR', os.path.join(_bench_dir, 'tiles'))
+os.environ.setdefault('SRP_COVERAGE_DIR', os.path.join(_bench_dir, 'coverage'))
+
+import logging
+import numpy as np
+import pandas as pd
+import backfill
+import srp_collect
+import storage
+from backfill_journal import BackfillJournal
+import usage_cache
+import weather
+import weather_tiles
+
+RESULTS_FILE = 'benchmark_results.json'
+
+# Backfill executor settings: workers fetching windows, and an SRP rate high enough
+# that the token bucket is exercised without dominating the timing
+BACKFILL_WORKERS = 4
+BACKFILL_RATE = 1000.0
+
+# Account the synthetic rows are stored under
+BENCH_ACCOUNT = 'benchmark'
+
+# Hours dropped at random from the synthetic history, plus a few long outages
+GAP_FRACTION = 0.005
+OUTAGES_PER_YEAR = 3
+
+class FakeSrpEnergyClient:
+    """Stand-in for srpenergy's SrpEnergyClient returning deterministic synthetic hourly usage"""
+
+    def __init__(self, accountid=None, username=None, password=None, seed=0):
+        self.seed = seed
+        self.calls = 0
+
+    def usage(self, startdate, enddate, is_tou=False):
+        self.calls += 1
+        rows = []
+        day = startdate.date()
+        while day <= enddate.date():
+            rng = np.random.default_rng(self.seed + day.toordinal())
+            kwh = 0.6 + 1.4 * np.clip(np.sin((np.arange(24) - 6) / 24 * 2 * np.pi), 0, None) + rng.random(24) * 0.3
+            for hour in range(24):
+                moment = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+                rows.append((
+                    f"{moment.month}/{moment.day}/{moment.year}",
+                    moment.strftime('%I:%M %p').lstrip('0'),
+                    moment.strftime('%Y-%m-%dT%H:%M:%S'),
+                    f"{kwh[hour]:.2f}",
+                    f"{kwh[hour] * 0.13:.2f}"
+                ))
+            day += timedelta(days=1)
+        return rows
+
+
+class _FakeVariable:
+    def __init__(self, values):
+        self.values = values
+
+    def ValuesAsNumpy(self):
+        return self.values
+
+
+class _FakeHourly:
+    def __init__(self, start, count):
+        self.start = start
+        hours = np.arange(count)
+        self.variables = [
+            _FakeVariable((70 + 20 * np.sin(hours / 24 * 2 * np.pi)).astype(np.float32)),
+            _FakeVariable((30 + 10 * np.cos(hours / 24 * 2 * np.pi)).astype(np.float32)),
+        ]
+
+    def Time(self):
+        return self.start
+
+    def Interval(self):
+        return 3600
+
+    def Variables(self, index):
+        return self.variables[index]
+
+
+class _FakeResponse:
+    def __init__(self, hourly):
+        self.hourly = hourly
+
+    def Hourly(self):
+        return self.hourly
+
+
+class FakeOpenMeteo:
+    """Stub for openmeteo_requests.Client.weather_api serving synthetic hourly weather"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def weather_api(self, url, params):
+        self.calls += 1
+        start = pd.Timestamp(params['start_date']).tz_localize(params['timezone'])
+        end = (pd.Timestamp(params['end_date']) + pd.Timedelta(days=1)).tz_localize(params['timezone'])
+        count = int((end - start) / pd.Timedelta(hours=1))
+        return [_FakeResponse(_FakeHourly(int(start.timestamp()), count))]
+
+
+def make_history(years, end_date, seed=0):
+    """Return (start_date, sorted hourly datetime64 array) for years of history with synthetic gaps"""
+    start_date = end_date - timedelta(days=int(365.25 * years))
+    hours = np.arange(np.datetime64(start_date, 'h'), np.datetime64(end_date + timedelta(days=1), 'h'))
+    rng = np.random.default_rng(seed)
+    keep = rng.random(len(hours)) >= GAP_FRACTION
+    for _ in range(int(OUTAGES_PER_YEAR * years)):
+        outage = rng.integers(0, len(hours))
+        keep[outage:outage + rng.integers(6, 24 * 10)] = False
+    return start_date, hours[keep]
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def store_hours(store, hours):
+    """Replace the benchmark account's rows with bare rows at the given hours"""
+    with store.conn:
+        store.conn.execute("DELETE FROM srp")
+        store.conn.executemany("INSERT INTO srp (account, datetime) VALUES (?, ?)",
+                               ((BENCH_ACCOUNT, str(hour.astype('datetime64[s]')).replace('T', ' '))
+                                for hour in hours))
+
+
+def bench_collect(start_date, end_date):
+    """Stream fake SRP usage through the daily collector pipeline into SQLite storage, rollups included"""
+    store = storage.SQLiteStorage(':memory:')
+    client = FakeSrpEnergyClient()
+
+    stats, seconds = timed(srp_collect.collect_usage, client, store, start_date, end_date, account=BENCH_ACCOUNT)
+    written = stats['written']
+    return store, {
+        'collect_rows': written,
+        'collect_seconds': seconds,
+        'collect_rows_per_sec': written / seconds if seconds else None,
+        'collect_srp_calls': client.calls,
+    }
+
+
+def bench_backfill(hours, start_date, end_date, workers=BACKFILL_WORKERS, rate=BACKFILL_RATE):
+    """
+    Fill the synthetic gaps with SrpDataManager.fetch_missing_data: window planning,
+    the worker pool, the token bucket, the journal and batched writes
+    """
+    store = storage.SQLiteStorage(':memory:')
+    store_hours(store, hours)
+    missing = store.find_missing_ranges(start_date, end_date, BENCH_ACCOUNT)
+
+    client = FakeSrpEnergyClient()
+    manager = backfill.SrpDataManager(account=BENCH_ACCOUNT, storage=store)
+    manager.get_srp_client = lambda: client
+    journal = BackfillJournal(os.path.join(_bench_dir, f'journal-{len(hours)}.sqlite'))
+
+    _, seconds = timed(manager.fetch_missing_data, missing, workers=workers, rate=rate, journal=journal)
+    written = store.conn.execute("SELECT COUNT(*) FROM srp").fetchone()[0] - len(hours)
+    assert not store.find_missing_ranges(start_date, end_date, BENCH_ACCOUNT), "backfill left gaps"
+    journal.close()
+    store.close()
+    return {
+        'backfill_missing_hours': backfill.count_range_hours(missing),
+        'backfill_rows': written,
+        'backfill_seconds': seconds,
+        'backfill_rows_per_sec': written / seconds if seconds else None,
+        'backfill_srp_calls': client.calls,
+    }
+
+
+def bench_gaps(store, hours, start_date, end_date):
+    """Time gap detection in SQL and on the in-memory datetime array"""
+    store_hours(store, hours)
+
+    sql_ranges, sql_seconds = timed(store.find_missing_ranges, start_date, end_date, BENCH_ACCOUNT)
+
+    array_ranges, array_seconds = timed(usage_cache.find_missing_ranges,
+                                        hours.astype('datetime64[s]'), start_date, end_date)
+    assert len(sql_ranges) == len(array_ranges), "SQL and array gap finders disagree"
+    return {
+        'gap_ranges': len(array_ranges),
+        'gap_sql_seconds': sql_seconds,
+        'gap_array_seconds': array_seconds,
+    }
+
+
+def bench_weather(hours, start_date, end_date):
+    """Time tiled weather retrieval (cold and warm) and the as-of join onto every row"""
+    stub = FakeOpenMeteo()
+    weather.openmeteo = stub
+    for name in os.listdir(weather_tiles.TILE_DIR) if os.path.isdir(weather_tiles.TILE_DIR) else []:
+        os.remove(os.path.join(weather_tiles.TILE_DIR, name))
+
+    args = (weather.DEFAULT_LATITUDE, weather.DEFAULT_LONGITUDE, start_date, end_date)
+    weather_df, cold_seconds = timed(weather.fetch_weather_data, *args)
+    _, warm_seconds = timed(weather.fetch_weather_data, *args)
+
+    weather_df['datetime'] = weather_df['datetime'].dt.tz_convert('America/Los_Angeles').dt.tz_localize(None)
+    rows_df = pd.DataFrame({'id': np.arange(len(hours)), 'datetime': hours.astype('datetime64[ns]')})
+    matched_df, join_seconds = timed(weather.attach_weather, rows_df, weather_df)
+    return {
+        'weather_fetch_cold_seconds': cold_seconds,
+        'weather_fetch_warm_seconds': warm_seconds,
+        'weather_api_calls': stub.calls,
+        'weather_join_seconds': join_seconds,
+        'weather_matched_rows': int(matched_df['temperature'].notna().sum()),
+    }
+
+
+def run(years_list):
+    end_date = date(2025, 6, 30)
+    results = {}
+    for years in years_list:
+        start_date, hours = make_history(years, end_date)
+        print(f"Benchmarking {years} year(s): {len(hours)} hourly rows")
+        store, collect_result = bench_collect(start_date, end_date)
+        result = {'rows': int(len(hours))}
+        result.update(collect_result)
+        result.update(bench_backfill(hours, start_date, end_date))
+        result.update(bench_gaps(store, hours, start_date, end_date))
+        result.update(bench_weather(hours, start_date, end_date))
+        store.close()
+        results[f"{years}y"] = result
+    return results
+
+
+def compare(previous, current):
+    """Print the change in every *_seconds metric against the previous run"""
+    for size, metrics in current.items():
+        for name, value in metrics.items():
+            old = previous.get(size, {}).get(name)
+            if name.endswith('_seconds') and old:
+                change = (value - old) / old * 100
+                flag = '  <-- slower' if change > 20 else ''
+                print(f"  {size} {name}: {old:.4f}s -> {value:.4f}s ({change:+.0f}%){flag}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of collector and backfill inserts, gap analysis and weather enrichment")
+    parser.add_argument('--years', default='1,5,20', help="Comma-separated history lengths in years")
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON results file; the previous one is compared against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # backfill logs every window at INFO; keep the benchmark output to the results
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run([int(years) for years in args.years.split(',')])
+
+    previous = {}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            previous = json.load(f).get('results', {})
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if previous:
+        print("Change since previous run:")
+        compare(previous, results)
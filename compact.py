@@ -0,0 +1,165 @@
+"""
+Remove duplicate hours from srp and report the space reclaimed
+
+Duplicate hours are found with one set-based ROW_NUMBER() query. For each hour,
+the best copy is kept: the one with weather filled, then the most recently
+updated, then the lowest id. The rest are deleted by id in short batches, each
+in its own transaction, so replicas never have to apply one huge delete. Run it
+before migrations 001/004 on a table that predates the unique hour key. Those
+migrations fail while duplicates remain.
+"""
+import argparse
+import logging
+import time
+from dotenv import load_dotenv
+import srp_db
+
+load_dotenv()
+
+# Rows deleted per transaction, and the pause between batches to let replicas and other writers keep up
+DELETE_BATCH_SIZE = 1000
+DELETE_PAUSE = 0.05
+
+# Only hours stored more than once are ranked; every copy after the first is returned.
+# Weather is compared as text so the check works on both the original VARCHAR
+# columns (where '' means missing) and the typed DECIMAL ones
+DUPLICATES_QUERY = """
+SELECT id, account, datetime, kwh
+FROM (
+    SELECT s.id, {account} AS account, s.datetime, s.kwh,
+           ROW_NUMBER() OVER (
+               PARTITION BY {partition}
+               ORDER BY (COALESCE(CAST(s.temperature AS CHAR), '') <> ''
+                         AND COALESCE(CAST(s.humidity AS CHAR), '') <> '') DESC,
+                        s.updated_at DESC,
+                        s.id
+           ) AS rn
+    FROM srp AS s
+    JOIN (
+        SELECT {partition_plain}
+        FROM srp
+        WHERE datetime IS NOT NULL
+        GROUP BY {partition_plain}
+        HAVING COUNT(*) > 1
+    ) AS d USING ({partition_plain})
+) AS ranked
+WHERE rn > 1
+ORDER BY id
+"""
+
+
+def has_account_column(conn):
+    """True once migrations/004_srp_account.py has added srp.account"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'srp' AND COLUMN_NAME = 'account'
+    """)
+    found = cursor.fetchone()[0] > 0
+    cursor.close()
+    return found
+
+
+def table_size(conn):
+    """Return (data + index bytes, estimated rows) for srp from information_schema"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DATA_LENGTH + INDEX_LENGTH, TABLE_ROWS FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'srp'
+    """)
+    size, rows = cursor.fetchone()
+    cursor.close()
+    return int(size or 0), int(rows or 0)
+
+
+def find_duplicates(conn):
+    """Return (id, account, datetime, kwh) for every copy of an hour that is not the one to keep"""
+    if has_account_column(conn):
+        query = DUPLICATES_QUERY.format(account='s.account', partition='s.account, s.datetime',
+                                        partition_plain='account, datetime')
+    else:
+        # Before 004 every row belongs to SRP_ACCOUNT; the literal keeps the result shape the same
+        query = DUPLICATES_QUERY.format(account="''", partition='s.datetime', partition_plain='datetime')
+    cursor = conn.cursor()
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def delete_rows(conn, ids, batch_size=DELETE_BATCH_SIZE, pause=DELETE_PAUSE):
+    """Delete srp rows by id, one short transaction per batch; returns the number deleted"""
+    deleted = 0
+    cursor = conn.cursor()
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        with srp_db.transaction(conn):
+            cursor.execute(f"DELETE FROM srp WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+            deleted += cursor.rowcount
+        logging.info(f"Deleted {deleted} of {len(ids)} duplicate rows")
+        time.sleep(pause)
+    cursor.close()
+    return deleted
+
+
+def compact(conn, dry_run=False, batch_size=DELETE_BATCH_SIZE, optimize=False):
+    """
+    Find and delete duplicate hours
+    With optimize, rebuild the table afterwards (OPTIMIZE TABLE, online for InnoDB) so freed pages go back to disk
+    Returns a dict with rows, hours, kwh and bytes; in a dry run bytes is an estimate from the average row size
+    """
+    size_before, table_rows = table_size(conn)
+    started = time.monotonic()
+    duplicates = find_duplicates(conn)
+    logging.info(f"Found {len(duplicates)} duplicate rows in {time.monotonic() - started:.2f}s")
+
+    report = {
+        'rows': len(duplicates),
+        'hours': len({(account, moment) for _, account, moment, _ in duplicates}),
+        # kWh the duplicates added to every SUM over srp; the VARCHAR schema stores '' for missing readings
+        'kwh': sum(float(kwh) for _, _, _, kwh in duplicates if kwh not in (None, '')),
+        'bytes': 0,
+    }
+    if dry_run or not duplicates:
+        report['bytes'] = size_before * len(duplicates) // table_rows if table_rows else 0
+        return report
+
+    # No rollup refresh: duplicates only exist before migration 001's unique key,
+    # and the rollup tables only arrive with 003
+    report['rows'] = delete_rows(conn, [row[0] for row in duplicates], batch_size)
+
+    cursor = conn.cursor()
+    if optimize:
+        logging.info("Rebuilding srp to return freed space to disk")
+        cursor.execute("OPTIMIZE TABLE srp")
+        cursor.fetchall()
+    # Refresh the information_schema statistics so the size below reflects the deletes;
+    # without a rebuild InnoDB keeps the freed pages for new rows, so little may show as reclaimed
+    cursor.execute("ANALYZE TABLE srp")
+    cursor.fetchall()
+    cursor.close()
+    report['bytes'] = size_before - table_size(conn)[0]
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Delete duplicate hours from srp, keeping the most complete row")
+    parser.add_argument('--dry-run', action='store_true', help="Report duplicates without deleting anything")
+    parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE, help="Rows deleted per transaction")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Rebuild the table afterwards so InnoDB returns the freed space to disk")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    with srp_db.connection() as conn:
+        report = compact(conn, args.dry_run, args.batch_size, args.optimize)
+
+    summary = (f"{report['rows']} duplicate rows across {report['hours']} hours "
+               f"({report['kwh']:.2f} kWh double-counted)")
+    if args.dry_run:
+        print(f"Would remove {summary}, about {report['bytes'] / 1024 / 1024:.1f} MB")
+    else:
+        print(f"Removed {summary}, {report['bytes'] / 1024 / 1024:.1f} MB reclaimed")
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+import argparse
+import csv
+import gzip
+import logging
+import os
+import time
+from dotenv import load_dotenv
+import metrics
+import srp_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional; CSV needs nothing extra
+    pa = None
+
+load_dotenv()
+
+# Rows per server-side fetch, which is also the Parquet row group size
+EXPORT_BATCH_SIZE = int(os.getenv('SRP_EXPORT_BATCH_SIZE', '50000'))
+
+COLUMNS = ['id', 'account', 'date', 'hour', 'isotime', 'kwh', 'cost', 'datetime', 'temperature', 'humidity', 'updated_at']
+
+NUMERIC_COLUMNS = {'kwh', 'cost', 'temperature', 'humidity'}
+
+
+def parquet_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('account', pa.string()),
+        ('date', pa.date32()),
+        ('hour', pa.int16()),
+        ('isotime', pa.string()),
+        ('kwh', pa.float64()),
+        ('cost', pa.float64()),
+        ('datetime', pa.timestamp('s')),
+        ('temperature', pa.float32()),
+        ('humidity', pa.float32()),
+        ('updated_at', pa.timestamp('s')),
+    ])
+
+
+def _newest(watermark, updated):
+    latest = max(updated)
+    return max(watermark, latest) if watermark else latest
+
+
+def build_query(start_date=None, end_date=None, since=None, account=None):
+    """Return (query, params) selecting the export columns in datetime order"""
+    conditions, params = [], []
+    if account is not None:
+        conditions.append("account = %s")
+        params.append(account)
+    if start_date:
+        conditions.append("datetime >= %s")
+        params.append(datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        conditions.append("datetime < %s")
+        params.append(datetime.combine(end_date, datetime.min.time()) + timedelta(days=1))
+    if since:
+        # >= so rows sharing the watermark second are exported again rather than missed
+        conditions.append("updated_at >= %s")
+        params.append(since)
+    query = f"SELECT {', '.join(COLUMNS)} FROM srp"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY account, datetime", tuple(params)
+
+
+def write_csv(batches, path):
+    """Write row batches as CSV, gzip-compressed when path ends in .gz; returns the updated_at watermark"""
+    opener = gzip.open if path.endswith('.gz') else open
+    watermark = None
+    with opener(path, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            watermark = _newest(watermark, (row[-1] for row in rows))
+    return watermark
+
+
+def write_parquet(batches, path, compression='zstd'):
+    """Write each row batch as one Parquet row group; returns the updated_at watermark"""
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = parquet_schema()
+    watermark = None
+    compression = None if compression == 'none' else compression
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            arrays = []
+            for name, values in zip(COLUMNS, columns):
+                if name in NUMERIC_COLUMNS:
+                    # DECIMAL columns arrive as Decimal
+                    values = [None if value is None else float(value) for value in values]
+                arrays.append(pa.array(values, type=schema.field(name).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            watermark = _newest(watermark, columns[-1])
+    return watermark
+
+
+def export(conn, path, fmt=None, start_date=None, end_date=None, since=None,
+           batch_size=EXPORT_BATCH_SIZE, compression='zstd', account=None):
+    """
+    Stream srp rows in a date range (and/or changed since a watermark) to CSV or Parquet,
+    for one account or, when account is None, all of them
+    Only one batch is held in memory at a time
+    Returns (rows written, newest updated_at exported)
+    """
+    fmt = fmt or ('parquet' if path.endswith('.parquet') else 'csv')
+    query, params = build_query(start_date, end_date, since, account)
+    stats = {'rows': 0}
+
+    def batches():
+        for rows in srp_db.stream(conn, query, params, batch_size):
+            stats['rows'] += len(rows)
+            metrics.incr('rows_exported', len(rows))
+            yield rows
+
+    started = time.monotonic()
+    with metrics.timer('export_write', format=fmt):
+        if fmt == 'parquet':
+            watermark = write_parquet(batches(), path, compression)
+        else:
+            watermark = write_csv(batches(), path)
+    elapsed = time.monotonic() - started
+    rate = f"{stats['rows'] / elapsed:.0f} rows/sec" if elapsed > 0 else "n/a"
+    logging.info(f"Exported {stats['rows']} rows to {path} in {elapsed:.2f}s ({rate})")
+    return stats['rows'], watermark
+
+
+def read_watermark(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_watermark(path, watermark):
+    with open(path + '.tmp', 'w') as f:
+        f.write(watermark.strftime('%Y-%m-%d %H:%M:%S') + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream srp usage and weather rows to CSV or Parquet")
+    parser.add_argument('output', help="Output file; .parquet selects Parquet, .csv.gz writes gzipped CSV")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="Override the format implied by the file name")
+    parser.add_argument('--account', help="Only this SRP account (default: every account)")
+    parser.add_argument('--start', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(), help="First date to export")
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(), help="Last date to export")
+    parser.add_argument('--since', help="Only rows with updated_at at or after this timestamp (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument('--watermark-file',
+                        help="Read --since from this file and store the newest exported updated_at in it afterwards")
+    parser.add_argument('--compression', default='zstd', help="Parquet codec: zstd, snappy, gzip or none")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE,
+                        help="Rows per server-side fetch and per Parquet row group")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    since = args.since or (read_watermark(args.watermark_file) if args.watermark_file else None)
+
+    with metrics.timer('export_total'), srp_db.connection() as conn:
+        rows, watermark = export(conn, args.output, args.format, args.start, args.end, since,
+                                 args.batch_size, args.compression, args.account)
+    if args.watermark_file and watermark:
+        save_watermark(args.watermark_file, watermark)
+        logging.info(f"Watermark {watermark} saved to {args.watermark_file}")
+    metrics.flush('export')
@@ -0,0 +1,253 @@
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+import argparse
+import json
+import logging
+import os
+from dotenv import load_dotenv
+import srp_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no cross-process locking
+    fcntl = None
+
+load_dotenv()
+
+# One bit per hour since the first stored hour, memory-mapped from INDEX_DIR/<account>/bits.bin
+INDEX_DIR = os.getenv('SRP_COVERAGE_DIR', '.coverage_index')
+
+# The bitmap grows in steps of this many hours (about a year) to avoid frequent resizes
+GROW_HOURS = 24 * 366
+
+
+def account_dir(account=None):
+    """Index directory of an account, SRP_ACCOUNT by default"""
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    return os.path.join(INDEX_DIR, account or 'default')
+
+
+def _paths(index_dir):
+    return os.path.join(index_dir, 'bits.bin'), os.path.join(index_dir, 'meta.json')
+
+
+@contextmanager
+def _locked(index_dir):
+    """Serialize writers across processes (cron collector, backfill) on the index directory"""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, '.lock'), 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_meta(index_dir=None):
+    """Return {'base_hour': epoch hours of bit 0 or None, 'hours': bitmap length in hours}"""
+    index_dir = index_dir or account_dir()
+    try:
+        with open(_paths(index_dir)[1]) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'base_hour': None, 'hours': 0}
+
+
+def _save_meta(index_dir, meta):
+    path = _paths(index_dir)[1]
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def _map_bits(index_dir, meta, mode='r'):
+    if not meta['hours']:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(_paths(index_dir)[0], dtype=np.uint8, mode=mode, shape=(meta['hours'] // 8,))
+
+
+def _to_hours(datetimes):
+    """Convert datetimes (any iterable or datetime64 array) to int64 epoch hours, dropping missing values"""
+    values = np.asarray(datetimes, dtype='datetime64[h]')
+    return values[~np.isnat(values)].astype(np.int64)
+
+
+def _resize(index_dir, meta, first_hour, last_hour):
+    """Grow the bitmap so it covers first_hour..last_hour, shifting it if first_hour is before bit 0"""
+    bits_path = _paths(index_dir)[0]
+    base = meta['base_hour']
+    if base is None:
+        base = first_hour - first_hour % 8
+    shift = 0
+    if first_hour < base:
+        # Whole bytes only, so existing bits keep their position within a byte
+        shift = ((base - first_hour + 7) // 8 + GROW_HOURS // 8) * 8
+    end = max(base + meta['hours'], last_hour + 1)
+    hours = ((end - (base - shift) + GROW_HOURS - 1) // GROW_HOURS) * GROW_HOURS
+
+    if shift:
+        old = np.array(_map_bits(index_dir, meta))
+        with open(bits_path + '.tmp', 'wb') as f:
+            f.write(bytes(shift // 8))
+            f.write(old.tobytes())
+        os.replace(bits_path + '.tmp', bits_path)
+    with open(bits_path, 'ab') as f:
+        f.truncate(hours // 8)
+
+    meta['base_hour'] = int(base - shift)
+    meta['hours'] = int(hours)
+
+
+def mark(datetimes, index_dir=None):
+    """Set the bit for every hour in datetimes"""
+    index_dir = index_dir or account_dir()
+    hours = _to_hours(datetimes)
+    if not len(hours):
+        return
+    with _locked(index_dir):
+        meta = load_meta(index_dir)
+        first, last = int(hours.min()), int(hours.max())
+        if meta['base_hour'] is None or first < meta['base_hour'] or last >= meta['base_hour'] + meta['hours']:
+            _resize(index_dir, meta, first, last)
+            _save_meta(index_dir, meta)
+        bits = _map_bits(index_dir, meta, 'r+')
+        offsets = hours - meta['base_hour']
+        np.bitwise_or.at(bits, offsets >> 3, (1 << (offsets & 7)).astype(np.uint8))
+        bits.flush()
+
+
+def _covered(index_dir, first_hour, last_hour):
+    """Return a bool array, one entry per hour in first_hour..last_hour inclusive"""
+    meta = load_meta(index_dir)
+    covered = np.zeros(last_hour - first_hour + 1, dtype=bool)
+    if meta['base_hour'] is None:
+        return covered
+    lo = max(first_hour, meta['base_hour'])
+    hi = min(last_hour, meta['base_hour'] + meta['hours'] - 1)
+    if lo > hi:
+        return covered
+    bits = _map_bits(index_dir, meta)
+    offset_lo, offset_hi = lo - meta['base_hour'], hi - meta['base_hour']
+    unpacked = np.unpackbits(bits[offset_lo >> 3:(offset_hi >> 3) + 1], bitorder='little')
+    start = offset_lo & 7
+    covered[lo - first_hour:hi - first_hour + 1] = unpacked[start:start + hi - lo + 1]
+    return covered
+
+
+def _day_bounds(start_date, end_date):
+    first = int(np.datetime64(start_date, 'D').astype('datetime64[h]').astype(np.int64))
+    last = int(np.datetime64(end_date, 'D').astype('datetime64[h]').astype(np.int64)) + 23
+    return first, last
+
+
+def bounds(index_dir=None):
+    """Return the (first, last) dates with any stored hour, or (None, None)"""
+    index_dir = index_dir or account_dir()
+    meta = load_meta(index_dir)
+    if meta['base_hour'] is None:
+        return None, None
+    offsets = np.nonzero(np.unpackbits(_map_bits(index_dir, meta), bitorder='little'))[0]
+    if not len(offsets):
+        return None, None
+    to_date = lambda offset: np.datetime64(int(meta['base_hour'] + offset), 'h').astype(datetime).date()
+    return to_date(offsets[0]), to_date(offsets[-1])
+
+
+def missing_ranges(start_date, end_date, index_dir=None):
+    """Return inclusive (gap_start, gap_end) hour datetimes missing between start_date and end_date"""
+    index_dir = index_dir or account_dir()
+    first, last = _day_bounds(start_date, end_date)
+    covered = _covered(index_dir, first, last)
+
+    # Run boundaries of the uncovered hours
+    padded = np.concatenate([[True], covered, [True]])
+    edges = np.diff(padded.astype(np.int8))
+    starts = np.nonzero(edges == -1)[0]
+    ends = np.nonzero(edges == 1)[0] - 1
+
+    to_datetime = lambda offsets: (np.asarray(offsets, dtype=np.int64) + first).astype('datetime64[h]').astype(datetime)
+    return list(zip(to_datetime(starts), to_datetime(ends)))
+
+
+def completeness(start_date, end_date, index_dir=None):
+    """Return the fraction of hours between start_date and end_date that are stored"""
+    index_dir = index_dir or account_dir()
+    first, last = _day_bounds(start_date, end_date)
+    return float(_covered(index_dir, first, last).mean())
+
+
+def _stream_hours(conn, account):
+    """Yield datetime64[h] arrays of every hour stored for account, a streaming batch at a time"""
+    query = "SELECT datetime FROM srp WHERE account = %s AND datetime IS NOT NULL ORDER BY datetime"
+    for rows in srp_db.stream(conn, query, (account,)):
+        yield np.array([row[0] for row in rows], dtype='datetime64[h]')
+
+
+def rebuild(conn, account=None):
+    """Discard an account's index and rebuild it from srp"""
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    index_dir = account_dir(account)
+    with _locked(index_dir):
+        for path in _paths(index_dir):
+            if os.path.exists(path):
+                os.remove(path)
+    count = 0
+    for hours in _stream_hours(conn, account):
+        mark(hours, index_dir)
+        count += len(hours)
+    logging.info(f"Rebuilt coverage index for account {account!r} from {count} rows")
+
+
+def verify(conn, account=None):
+    """
+    Compare an account's index against srp
+    Returns (hours stored but not indexed, hours indexed but not stored)
+    """
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    index_dir = account_dir(account)
+    meta = load_meta(index_dir)
+    stored = np.concatenate(list(_stream_hours(conn, account)) or [np.empty(0, dtype='datetime64[h]')])
+    stored = np.unique(stored.astype(np.int64))
+    if not len(stored):
+        indexed = int(np.unpackbits(_map_bits(index_dir, meta)).sum()) if meta['hours'] else 0
+        return 0, indexed
+
+    first = min(int(stored[0]), meta['base_hour'] if meta['base_hour'] is not None else int(stored[0]))
+    last = max(int(stored[-1]), (meta['base_hour'] or 0) + meta['hours'] - 1)
+    expected = np.zeros(last - first + 1, dtype=bool)
+    expected[stored - first] = True
+    actual = _covered(index_dir, first, last)
+    return int((expected & ~actual).sum()), int((actual & ~expected).sum())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain the hour-coverage bitmap of the srp table")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the index from the database")
+    parser.add_argument('--verify', action='store_true', help="Compare the index against the database")
+    parser.add_argument('--account', default=srp_db.DEFAULT_ACCOUNT, help="SRP account (default SRP_ACCOUNT)")
+    parser.add_argument('--start', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(), help="Report from this date")
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(), help="Report through this date")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    if args.rebuild or args.verify:
+        with srp_db.connection() as conn:
+            if args.rebuild:
+                rebuild(conn, args.account)
+            if args.verify:
+                not_indexed, not_stored = verify(conn, args.account)
+                print(f"Hours stored but not indexed: {not_indexed}")
+                print(f"Hours indexed but not stored: {not_stored}")
+
+    index_dir = account_dir(args.account)
+    first, last = bounds(index_dir)
+    start, end = args.start or first, args.end or last
+    if start and end:
+        ranges = missing_ranges(start, end, index_dir)
+        print(f"{start} to {end}: {completeness(start, end, index_dir):.2%} complete, {len(ranges)} missing ranges")
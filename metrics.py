@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Optional outputs: a JSON-lines event log and a Prometheus textfile-collector file
+JSON_LOG_PATH = os.getenv('SRP_METRICS_JSON_LOG')
+PROMETHEUS_TEXTFILE = os.getenv('SRP_METRICS_TEXTFILE')
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+
+logger = logging.getLogger('srp.metrics')
+logger.propagate = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record and its `fields` extra as a single JSON object per line"""
+
+    def format(self, record):
+        event = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': record.getMessage(),
+        }
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, default=str)
+
+
+if JSON_LOG_PATH:
+    _handler = logging.FileHandler(JSON_LOG_PATH)
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+def log_event(event, **fields):
+    """Write a structured event to the JSON log, if one is configured"""
+    if logger.handlers:
+        logger.info(event, extra={'fields': fields})
+
+
+@contextmanager
+def timer(stage, **fields):
+    """Time a block and record it under stage; the JSON log gets one event per call"""
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            stats = _timers.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max': 0.0, 'errors': 0})
+            stats['count'] += 1
+            stats['seconds'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['errors'] += status == 'error'
+        log_event('stage', stage=stage, seconds=round(elapsed, 6), status=status, **fields)
+
+
+def incr(name, value=1):
+    """Add value to a counter such as rows_fetched or rows_written"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Return copies of the current timers and counters"""
+    with _lock:
+        return {stage: dict(stats) for stage, stats in _timers.items()}, dict(_counters)
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def write_prometheus(path, job):
+    """Write every timer and counter in Prometheus text format, atomically for the textfile collector"""
+    timers, counters = snapshot()
+    lines = [
+        '# HELP srp_stage_seconds_total Time spent in each pipeline stage.',
+        '# TYPE srp_stage_seconds_total counter',
+    ]
+    lines += [f'srp_stage_seconds_total{{job="{job}",stage="{stage}"}} {stats["seconds"]:.6f}'
+              for stage, stats in sorted(timers.items())]
+    lines += ['# HELP srp_stage_calls_total Calls of each pipeline stage.', '# TYPE srp_stage_calls_total counter']
+    lines += [f'srp_stage_calls_total{{job="{job}",stage="{stage}"}} {stats["count"]}'
+              for stage, stats in sorted(timers.items())]
+    lines += ['# HELP srp_stage_errors_total Failed calls of each pipeline stage.', '# TYPE srp_stage_errors_total counter']
+    lines += [f'srp_stage_errors_total{{job="{job}",stage="{stage}"}} {stats["errors"]}'
+              for stage, stats in sorted(timers.items())]
+    lines += ['# HELP srp_stage_seconds_max Slowest single call of each pipeline stage.', '# TYPE srp_stage_seconds_max gauge']
+    lines += [f'srp_stage_seconds_max{{job="{job}",stage="{stage}"}} {stats["max"]:.6f}'
+              for stage, stats in sorted(timers.items())]
+    for name, value in sorted(counters.items()):
+        lines += [f'# TYPE srp_{name}_total counter', f'srp_{name}_total{{job="{job}"}} {value}']
+    lines += ['# TYPE srp_last_run_timestamp_seconds gauge', f'srp_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}']
+
+    with open(path + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def flush(job, textfile=PROMETHEUS_TEXTFILE):
+    """Log a run summary and write the Prometheus textfile if one is configured"""
+    timers, counters = snapshot()
+    for stage, stats in sorted(timers.items()):
+        logging.info(f"[metrics] {stage}: {stats['count']} calls, {stats['seconds']:.2f}s total, "
+                     f"{stats['max']:.2f}s max")
+    if counters:
+        logging.info("[metrics] " + ", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+    log_event('summary', job=job, timers=timers, counters=counters)
+    if textfile:
+        # The textfile collector reads *.prom files; one file per job keeps scripts from overwriting each other
+        path = textfile if textfile.endswith('.prom') else os.path.join(textfile, f"srp_{job}.prom")
+        write_prometheus(path, job)
@@ -0,0 +1,115 @@
+from datetime import datetime
+import argparse
+import importlib.util
+import logging
+import os
+from dotenv import load_dotenv
+import srp_db
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('srp_data_collection.log'),
+        logging.StreamHandler()
+    ]
+)
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def list_migrations():
+    """Return (version, path) pairs for every migration file, in version order"""
+    migrations = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        stem, ext = os.path.splitext(name)
+        if ext in ('.sql', '.py') and stem[:3].isdigit():
+            migrations.append((stem, os.path.join(MIGRATIONS_DIR, name)))
+    return migrations
+
+
+def get_applied_versions(conn):
+    """Create the bookkeeping table if needed and return the applied versions"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version varchar(255) NOT NULL,
+            applied_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        ) ENGINE=InnoDB
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return applied
+
+
+def run_sql_migration(conn, path):
+    """Execute each ;-terminated statement in a .sql migration"""
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith('--')]
+    cursor = conn.cursor()
+    for statement in ''.join(lines).split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+
+def run_python_migration(conn, path):
+    """Load a .py migration and call its upgrade(conn)"""
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(conn)
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations in order, up to and including target if given"""
+    applied = get_applied_versions(conn)
+    pending = [(version, path) for version, path in list_migrations()
+               if version not in applied and (target is None or version <= target)]
+    
+    if not pending:
+        logging.info("Schema is up to date")
+        return
+    
+    for version, path in pending:
+        logging.info(f"Applying {version}")
+        started = datetime.now()
+        if path.endswith('.py'):
+            run_python_migration(conn, path)
+        else:
+            run_sql_migration(conn, path)
+        
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+        cursor.close()
+        logging.info(f"Applied {version} in {(datetime.now() - started).total_seconds():.1f}s")
+
+
+def print_status(conn):
+    """Print each migration and whether it has been applied"""
+    applied = get_applied_versions(conn)
+    for version, _ in list_migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {version}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations to the srp database")
+    parser.add_argument('--status', action='store_true', help="List migrations and whether they are applied")
+    parser.add_argument('--target', help="Stop after this migration version (e.g. 002_srp_typed_columns)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with srp_db.connection() as conn:
+        if args.status:
+            print_status(conn)
+        else:
+            migrate(conn, args.target)
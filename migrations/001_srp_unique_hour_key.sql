@@ -0,0 +1,5 @@
+-- Make each hour unique in srp so ingest can be rerun safely with
+-- INSERT ... ON DUPLICATE KEY UPDATE.
+-- Fails with a duplicate entry error if the table already holds the same hour
+-- more than once; remove those rows before applying.
+ALTER TABLE `srp` ADD UNIQUE KEY `uq_srp_datetime` (`datetime`);
@@ -0,0 +1,93 @@
+"""
+Convert srp to typed columns and add the indexes the scripts query on
+
+The table is rebuilt online: a typed copy is created, rows are copied over in
+short id-range chunks, changes made during the copy are replayed, and the two
+tables are swapped under a brief write lock. The original table is kept as
+srp_old until it is dropped by hand.
+"""
+import logging
+import time
+
+# Rows copied per transaction, and the pause between chunks to let other writers in
+CHUNK_SIZE = 5000
+CHUNK_PAUSE = 0.05
+
+CREATE_TYPED_TABLE = """
+CREATE TABLE `srp_new` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `date` date DEFAULT NULL,
+  `hour` smallint DEFAULT NULL,
+  `kwh` decimal(12,4) DEFAULT NULL,
+  `cost` decimal(12,4) DEFAULT NULL,
+  `isotime` varchar(32) DEFAULT NULL,
+  `datetime` timestamp NULL DEFAULT NULL,
+  `temperature` decimal(6,2) DEFAULT NULL,
+  `humidity` decimal(5,2) DEFAULT NULL,
+  `weather_missing` tinyint AS (`temperature` IS NULL OR `humidity` IS NULL) STORED,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_srp_datetime` (`datetime`),
+  KEY `idx_srp_weather_missing` (`weather_missing`, `id`, `datetime`),
+  KEY `idx_srp_updated_at` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3
+"""
+
+# date and hour are derived from datetime; the numeric columns are cast from
+# their VARCHAR text, treating empty strings as NULL
+COPY_COLUMNS = """
+    (id, created_at, updated_at, `date`, `hour`, kwh, cost, isotime, datetime, temperature, humidity)
+    SELECT id, created_at, updated_at, DATE(datetime), HOUR(datetime),
+           CAST(NULLIF(kwh, '') AS DECIMAL(12,4)),
+           CAST(NULLIF(cost, '') AS DECIMAL(12,4)),
+           isotime, datetime,
+           CAST(NULLIF(temperature, '') AS DECIMAL(6,2)),
+           CAST(NULLIF(humidity, '') AS DECIMAL(5,2))
+    FROM srp
+"""
+
+
+def copy_changed_rows(cursor, since):
+    """Replay rows inserted or updated in srp since the given server timestamp"""
+    cursor.execute("REPLACE INTO srp_new" + COPY_COLUMNS + "WHERE updated_at >= %s", (since,))
+    return cursor.rowcount
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS srp_new")
+    cursor.execute(CREATE_TYPED_TABLE)
+    
+    cursor.execute("SELECT NOW(), COALESCE(MAX(id), 0) FROM srp")
+    copy_started, max_id = cursor.fetchone()
+    
+    # Chunked copy by primary key range keeps each transaction short
+    last_id = 0
+    copied = 0
+    while last_id < max_id:
+        cursor.execute("INSERT INTO srp_new" + COPY_COLUMNS + "WHERE id > %s AND id <= %s",
+                       (last_id, last_id + CHUNK_SIZE))
+        conn.commit()
+        copied += cursor.rowcount
+        last_id += CHUNK_SIZE
+        time.sleep(CHUNK_PAUSE)
+    logging.info(f"Copied {copied} rows into srp_new")
+    
+    # Catch up on writes made during the copy while writers still run
+    cursor.execute("SELECT NOW()")
+    catch_up_started = cursor.fetchone()[0]
+    replayed = copy_changed_rows(cursor, copy_started)
+    conn.commit()
+    logging.info(f"Replayed {replayed} rows changed during the copy")
+    
+    # Final catch-up and swap under a short write lock
+    cursor.execute("LOCK TABLES srp WRITE, srp_new WRITE")
+    try:
+        copy_changed_rows(cursor, catch_up_started)
+        cursor.execute("RENAME TABLE srp TO srp_old, srp_new TO srp")
+    finally:
+        cursor.execute("UNLOCK TABLES")
+    conn.commit()
+    cursor.close()
+    logging.info("Swapped in typed srp table; the original is kept as srp_old")
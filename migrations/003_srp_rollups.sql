@@ -0,0 +1,31 @@
+-- Daily and monthly rollups of srp, maintained incrementally by rollups.py
+CREATE TABLE IF NOT EXISTS `srp_daily` (
+  `day` date NOT NULL,
+  `kwh` decimal(14,4) DEFAULT NULL,
+  `cost` decimal(14,4) DEFAULT NULL,
+  `peak_hour` timestamp NULL DEFAULT NULL,
+  `peak_kwh` decimal(12,4) DEFAULT NULL,
+  `temp_min` decimal(6,2) DEFAULT NULL,
+  `temp_max` decimal(6,2) DEFAULT NULL,
+  `temp_avg` decimal(6,2) DEFAULT NULL,
+  `temp_hours` smallint NOT NULL DEFAULT 0,
+  `hour_count` smallint NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`day`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3;
+
+CREATE TABLE IF NOT EXISTS `srp_monthly` (
+  `month` date NOT NULL,
+  `kwh` decimal(16,4) DEFAULT NULL,
+  `cost` decimal(16,4) DEFAULT NULL,
+  `peak_hour` timestamp NULL DEFAULT NULL,
+  `peak_kwh` decimal(12,4) DEFAULT NULL,
+  `temp_min` decimal(6,2) DEFAULT NULL,
+  `temp_max` decimal(6,2) DEFAULT NULL,
+  `temp_avg` decimal(6,2) DEFAULT NULL,
+  `temp_hours` int NOT NULL DEFAULT 0,
+  `hour_count` int NOT NULL DEFAULT 0,
+  `expected_hours` int NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3;
@@ -0,0 +1,49 @@
+"""
+Tag every srp row and rollup with the SRP account it belongs to
+
+Adds an account column to srp, srp_daily and srp_monthly, fills it with
+SRP_ACCOUNT for existing rows in short id-range chunks, and widens the unique
+hour key and the rollup primary keys to (account, ...), so several meters can
+share the tables without their hours colliding.
+"""
+import logging
+import os
+import time
+
+# Rows tagged per transaction, and the pause between chunks to let other writers in
+CHUNK_SIZE = 5000
+CHUNK_PAUSE = 0.05
+
+
+def upgrade(conn):
+    account = os.getenv('SRP_ACCOUNT', '')
+    cursor = conn.cursor()
+
+    cursor.execute("ALTER TABLE srp ADD COLUMN `account` varchar(32) NOT NULL DEFAULT '' AFTER `id`")
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM srp")
+    max_id = cursor.fetchone()[0]
+    last_id = 0
+    while last_id < max_id:
+        cursor.execute("UPDATE srp SET account = %s WHERE id > %s AND id <= %s",
+                       (account, last_id, last_id + CHUNK_SIZE))
+        conn.commit()
+        last_id += CHUNK_SIZE
+        time.sleep(CHUNK_PAUSE)
+    logging.info(f"Tagged srp rows through id {max_id} with account {account!r}")
+
+    cursor.execute("""
+        ALTER TABLE srp
+            DROP INDEX `uq_srp_datetime`,
+            ADD UNIQUE KEY `uq_srp_account_datetime` (`account`, `datetime`),
+            DROP INDEX `idx_srp_weather_missing`,
+            ADD KEY `idx_srp_weather_missing` (`account`, `weather_missing`, `id`, `datetime`),
+            ALGORITHM=INPLACE, LOCK=NONE
+    """)
+
+    # The rollups are small, so these are plain ALTERs
+    for table, key in (('srp_daily', 'day'), ('srp_monthly', 'month')):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN `account` varchar(32) NOT NULL DEFAULT '' FIRST")
+        cursor.execute(f"UPDATE {table} SET account = %s", (account,))
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (`account`, `{key}`)")
+    conn.commit()
+    cursor.close()
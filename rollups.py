@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+import argparse
+import logging
+from dotenv import load_dotenv
+import metrics
+import srp_db
+
+load_dotenv()
+
+# Days recomputed per statement during a full rebuild
+REBUILD_CHUNK_DAYS = 31
+
+# Per-day totals plus the single highest hour of each day, for one account
+REFRESH_DAILY_QUERY = """
+INSERT INTO srp_daily (account, day, kwh, cost, peak_hour, peak_kwh, temp_min, temp_max, temp_avg, temp_hours, hour_count)
+SELECT %s, d.day, d.kwh, d.cost, p.datetime, p.kwh, d.temp_min, d.temp_max, d.temp_avg, d.temp_hours, d.hour_count
+FROM (
+    SELECT DATE(datetime) AS day,
+           SUM(kwh) AS kwh,
+           SUM(cost) AS cost,
+           MIN(temperature) AS temp_min,
+           MAX(temperature) AS temp_max,
+           AVG(temperature) AS temp_avg,
+           COUNT(temperature) AS temp_hours,
+           COUNT(DISTINCT HOUR(datetime)) AS hour_count
+    FROM srp
+    WHERE account = %s AND datetime >= %s AND datetime < %s
+    GROUP BY DATE(datetime)
+) AS d
+JOIN (
+    SELECT DATE(datetime) AS day, datetime, kwh,
+           ROW_NUMBER() OVER (PARTITION BY DATE(datetime) ORDER BY kwh DESC, datetime) AS rn
+    FROM srp
+    WHERE account = %s AND datetime >= %s AND datetime < %s
+) AS p ON p.day = d.day AND p.rn = 1
+"""
+
+# Months are rolled up from the daily table, never from srp
+REFRESH_MONTHLY_QUERY = """
+INSERT INTO srp_monthly (account, month, kwh, cost, peak_hour, peak_kwh, temp_min, temp_max, temp_avg,
+                         temp_hours, hour_count, expected_hours)
+SELECT %s, m.month, m.kwh, m.cost, p.peak_hour, p.peak_kwh, m.temp_min, m.temp_max, m.temp_avg,
+       m.temp_hours, m.hour_count, DAY(LAST_DAY(m.month)) * 24
+FROM (
+    SELECT DATE_FORMAT(day, '%%Y-%%m-01') AS month,
+           SUM(kwh) AS kwh,
+           SUM(cost) AS cost,
+           MIN(temp_min) AS temp_min,
+           MAX(temp_max) AS temp_max,
+           SUM(temp_avg * temp_hours) / NULLIF(SUM(temp_hours), 0) AS temp_avg,
+           SUM(temp_hours) AS temp_hours,
+           SUM(hour_count) AS hour_count
+    FROM srp_daily
+    WHERE account = %s AND day >= %s AND day < %s
+    GROUP BY month
+) AS m
+JOIN (
+    SELECT DATE_FORMAT(day, '%%Y-%%m-01') AS month, peak_hour, peak_kwh,
+           ROW_NUMBER() OVER (PARTITION BY DATE_FORMAT(day, '%%Y-%%m-01') ORDER BY peak_kwh DESC, peak_hour) AS rn
+    FROM srp_daily
+    WHERE account = %s AND day >= %s AND day < %s
+) AS p ON p.month = m.month AND p.rn = 1
+"""
+
+
+def contiguous_ranges(days):
+    """Group dates into inclusive (first, last) runs of consecutive days"""
+    ranges = []
+    for day in sorted(set(days)):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def refresh_days(conn, days, account=None):
+    """Recompute an account's daily rollups for the given dates and the monthly rollups of their months"""
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    days = {day.date() if isinstance(day, datetime) else day for day in days if day is not None}
+    if not days:
+        return
+
+    with metrics.timer('rollup_refresh', days=len(days)):
+        cursor = conn.cursor()
+        with srp_db.transaction(conn):
+            for first, last in contiguous_ranges(days):
+                start = datetime.combine(first, datetime.min.time())
+                end = datetime.combine(last, datetime.min.time()) + timedelta(days=1)
+                # Delete then re-insert so days that no longer have rows disappear too
+                cursor.execute("DELETE FROM srp_daily WHERE account = %s AND day >= %s AND day <= %s",
+                               (account, first, last))
+                cursor.execute(REFRESH_DAILY_QUERY, (account, account, start, end, account, start, end))
+
+            for month in sorted({month_start(day) for day in days}):
+                end = next_month(month)
+                cursor.execute("DELETE FROM srp_monthly WHERE account = %s AND month = %s", (account, month))
+                cursor.execute(REFRESH_MONTHLY_QUERY, (account, account, month, end, account, month, end))
+        cursor.close()
+    metrics.incr('rollup_days_refreshed', len(days))
+
+
+def rebuild(conn, chunk_days=REBUILD_CHUNK_DAYS):
+    """Recompute both rollup tables from scratch for every account, a chunk of days per transaction"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT account, DATE(MIN(datetime)), DATE(MAX(datetime))
+        FROM srp
+        WHERE datetime IS NOT NULL
+        GROUP BY account
+    """)
+    accounts = cursor.fetchall()
+    with srp_db.transaction(conn):
+        cursor.execute("DELETE FROM srp_daily")
+        cursor.execute("DELETE FROM srp_monthly")
+    cursor.close()
+
+    if not accounts:
+        logging.info("srp is empty; rollups cleared")
+        return
+
+    for account, first, last in accounts:
+        day = first
+        while day <= last:
+            chunk_end = min(day + timedelta(days=chunk_days - 1), last)
+            refresh_days(conn, [day + timedelta(days=i) for i in range((chunk_end - day).days + 1)], account)
+            day = chunk_end + timedelta(days=1)
+        logging.info(f"Rebuilt rollups for account {account!r}, {first} to {last}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain the srp_daily and srp_monthly rollup tables")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute every rollup from srp")
+    parser.add_argument('--account', default=srp_db.DEFAULT_ACCOUNT,
+                        help="SRP account to refresh with --start/--end (default SRP_ACCOUNT)")
+    parser.add_argument('--start', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help="First date to refresh (YYYY-MM-DD)")
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help="Last date to refresh (YYYY-MM-DD); defaults to --start")
+    args = parser.parse_args()
+    if not args.rebuild and not args.start:
+        parser.error("pass --rebuild or --start")
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    with srp_db.connection() as conn:
+        if args.rebuild:
+            rebuild(conn)
+        else:
+            end = args.end or args.start
+            refresh_days(conn, [args.start + timedelta(days=i) for i in range((end - args.start).days + 1)],
+                         args.account)
+            logging.info(f"Refreshed rollups for {args.start} to {end}")
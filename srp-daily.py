@@ -1,50 +1,69 @@
-from datetime import datetime, timedelta
-from srpenergy.client import SrpEnergyClient
-import MySQLdb
-import array
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-    
-mydb = MySQLdb.Connection(
-host=os.getenv('BI_HOST'),
-user=os.getenv('BI_USER'),
-password=os.getenv('BI_PASS'),
-port=3306,
-db=os.getenv('GEN_DB_NAME')
-)
-cursor = mydb.cursor()
-i = 0
-x = i+1
-print(i)    
-while i < 1: #to backfill, adjust the 2 here to the range size and the i to a relative start date. Otherwise this loops once for a day's worth of data
-    accountid = os.getenv('SRP_ACCOUNT')
-    try:
-        username =os.getenv('SRP_USER')
-        password = os.getenv('SRP_PASS')
-        end_date = datetime.now() - timedelta(days=i)
-        start_date = datetime.now() - timedelta(days=x)
-
-        client = SrpEnergyClient(accountid, username, password)
-        usage = client.usage(start_date, end_date)
-
-        date, hour, isodate, kwh, cost = usage[0]
-        for row in usage:
-            my_list = []
-            rawTime = row[2]
-            formatTime = datetime.strptime(rawTime, '%Y-%m-%dT%H:%M:%S')
-            my_list.append(row[0])
-            my_list.append(row[1])
-            my_list.append(row[2])
-            my_list.append(row[3])
-            my_list.append(row[4])
-            my_list.append(formatTime)
-            print(my_list)
-            cursor.execute('INSERT INTO srp(date, hour, isotime, kwh, cost, datetime)VALUES(%s, %s, %s, %s, %s, %s)',my_list)
-        mydb.commit()
-        i = i + 1
-        x = i + 1
-    except Exception as e:    
-        print(e)
-cursor.close()
+from datetime import datetime, timedelta
+from srpenergy.client import SrpEnergyClient
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+from srp_collect import collect_usage
+import metrics
+import storage
+from srp_writer import WRITE_BATCH_SIZE
+from weather import DEFAULT_LATITUDE, DEFAULT_LONGITUDE
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('srp_data_collection.log'),
+        logging.StreamHandler()
+    ]
+)
+
+load_dotenv()
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Collect SRP hourly usage into the configured database. Defaults to yesterday and today."
+    )
+    parser.add_argument('--account', default=os.getenv('SRP_ACCOUNT'), help="SRP account (default SRP_ACCOUNT)")
+    parser.add_argument('--start', type=parse_date, help="First date to collect (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_date, help="Last date to collect (YYYY-MM-DD); defaults to today")
+    parser.add_argument('--days', type=int, default=1,
+                        help="Without --start, collect this many days back from --end (default 1)")
+    parser.add_argument('--batch-size', type=int, default=WRITE_BATCH_SIZE, help="Rows per database write")
+    parser.add_argument('--with-weather', action='store_true',
+                        help="Join Open-Meteo weather in memory and write complete rows in one pass")
+    parser.add_argument('--latitude', type=float, default=DEFAULT_LATITUDE, help="Weather location latitude")
+    parser.add_argument('--longitude', type=float, default=DEFAULT_LONGITUDE, help="Weather location longitude")
+    args = parser.parse_args()
+
+    args.end = args.end or datetime.now().date()
+    args.start = args.start or args.end - timedelta(days=args.days)
+    if args.start > args.end:
+        parser.error("--start must not be after --end")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    client = SrpEnergyClient(args.account, os.getenv('SRP_USER'), os.getenv('SRP_PASS'))
+
+    try:
+        with metrics.timer('collect_total', start=args.start, end=args.end):
+            with storage.open_storage() as store:
+                collect_usage(client, store, args.start, args.end, args.batch_size,
+                              with_weather=args.with_weather, latitude=args.latitude, longitude=args.longitude,
+                              account=args.account)
+    finally:
+        metrics.flush('daily')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,19 @@
 CREATE TABLE `srp` (
   `id` int NOT NULL AUTO_INCREMENT,
+  `account` varchar(32) NOT NULL DEFAULT '',
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-  `date` varchar(255) DEFAULT NULL,
-  `hour` varchar(255) DEFAULT NULL,
-  `kwh` varchar(45) DEFAULT NULL,
-  `cost` varchar(45) DEFAULT NULL,
-  `isotime` varchar(265) DEFAULT NULL,
+  `date` date DEFAULT NULL,
+  `hour` smallint DEFAULT NULL,
+  `kwh` decimal(12,4) DEFAULT NULL,
+  `cost` decimal(12,4) DEFAULT NULL,
+  `isotime` varchar(32) DEFAULT NULL,
   `datetime` timestamp NULL DEFAULT NULL,
-  `temperature` varchar(255) DEFAULT NULL,
-  `humidity` varchar(45) DEFAULT NULL,
-  PRIMARY KEY (`id`)
-) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb3;
\ No newline at end of file
+  `temperature` decimal(6,2) DEFAULT NULL,
+  `humidity` decimal(5,2) DEFAULT NULL,
+  `weather_missing` tinyint AS (`temperature` IS NULL OR `humidity` IS NULL) STORED,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_srp_account_datetime` (`account`, `datetime`),
+  KEY `idx_srp_weather_missing` (`account`, `weather_missing`, `id`, `datetime`),
+  KEY `idx_srp_updated_at` (`updated_at`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb3;
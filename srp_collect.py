@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+import logging
+import pandas as pd
+import metrics
+from srp_writer import WRITE_BATCH_SIZE, parse_usage_row
+from weather import attach_weather, fetch_local_weather
+
+# Largest date span requested from SRP in a single usage() call
+SRP_MAX_WINDOW_DAYS = 30
+
+
+def iter_windows(start_date, end_date, max_days=SRP_MAX_WINDOW_DAYS):
+    """Yield (first_day, last_day) date windows of at most max_days covering start_date..end_date inclusive"""
+    current = start_date
+    while current <= end_date:
+        last_day = min(current + timedelta(days=max_days - 1), end_date)
+        yield current, last_day
+        current = last_day + timedelta(days=1)
+
+
+def fetch_usage(client, windows):
+    """Yield raw SRP usage tuples one window at a time, so only one window is held in memory"""
+    for first_day, last_day in windows:
+        # SRP only looks at the date part of each bound; both days are inclusive
+        start = datetime.combine(first_day, datetime.min.time())
+        end = min(datetime.combine(last_day, datetime.min.time()), datetime.now())
+        # srpenergy logs in inside usage(), so this covers login and the usage call
+        with metrics.timer('srp_usage', first_day=first_day, last_day=last_day):
+            usage = client.usage(start, end)
+        metrics.incr('rows_fetched', len(usage or []))
+        logging.info(f"Fetched {len(usage or [])} rows for {first_day} to {last_day}")
+        yield from usage or []
+
+
+def parse_usage(rows):
+    """Yield (date, hour, isotime, kwh, cost, datetime) rows ready for srp"""
+    for row in rows:
+        yield parse_usage_row(row)
+
+
+def validate_usage(rows, start_date, end_date, stats):
+    """Drop rows outside start_date..end_date or with non-numeric kWh/cost, counting them in stats"""
+    for row in rows:
+        if not start_date <= row[0] <= end_date:
+            stats['out_of_range'] += 1
+            continue
+        try:
+            float(row[3])
+            float(row[4])
+        except (TypeError, ValueError):
+            logging.warning(f"Skipping {row[2]}: invalid kwh/cost {row[3]!r}/{row[4]!r}")
+            stats['invalid'] += 1
+            continue
+        yield row
+
+
+def newer_than(rows, after, stats):
+    """Drop rows at or before the after datetime (hours already stored), counting them in stats"""
+    for row in rows:
+        if after is not None and row[5] <= after:
+            stats['already_stored'] += 1
+            continue
+        yield row
+
+
+def batched(rows, batch_size):
+    """Group a row stream into lists of at most batch_size rows"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def add_weather(batches, latitude, longitude, stats):
+    """
+    Join each batch to Open-Meteo hourly weather in memory, yielding rows with
+    temperature and humidity appended (None where no reading is available yet)
+    """
+    for batch in batches:
+        rows_df = pd.DataFrame({'datetime': [row[5] for row in batch], 'position': range(len(batch))})
+        try:
+            weather_df = fetch_local_weather(latitude, longitude,
+                                             rows_df['datetime'].min().date(),
+                                             min(rows_df['datetime'].max().date(), datetime.now().date()))
+            matched_df = attach_weather(rows_df, weather_df).sort_values('position')
+            readings = zip(matched_df['temperature'].tolist(), matched_df['humidity'].tolist())
+        except Exception as e:
+            logging.warning(f"Weather fetch failed, writing batch without weather: {e}")
+            readings = [(None, None)] * len(batch)
+
+        enriched = []
+        for row, (temperature, humidity) in zip(batch, readings):
+            if pd.isna(temperature) or pd.isna(humidity):
+                temperature = humidity = None
+                stats['without_weather'] += 1
+            enriched.append(row + (temperature, humidity))
+        yield enriched
+
+
+def collect_usage(client, store, start_date, end_date, batch_size=WRITE_BATCH_SIZE, max_days=SRP_MAX_WINDOW_DAYS,
+                  with_weather=False, latitude=None, longitude=None, account=None, after=None):
+    """
+    Stream SRP usage for start_date..end_date (inclusive) into srp through a storage backend:
+    fetch -> parse -> validate -> batch [-> join weather] -> write
+    With with_weather, complete rows are written in one pass; hours the weather
+    archive does not cover yet are left NULL for weather.py to repair
+    Rows are stored under account, or SRP_ACCOUNT when it is not given
+    With after, only hours later than that datetime are written
+    Returns a dict of row counts plus 'latest', the newest hour written (or None)
+    """
+    stats = {'written': 0, 'out_of_range': 0, 'invalid': 0, 'without_weather': 0, 'already_stored': 0,
+             'latest': None}
+
+    rows = fetch_usage(client, iter_windows(start_date, end_date, max_days))
+    rows = validate_usage(parse_usage(rows), start_date, end_date, stats)
+    rows = newer_than(rows, after, stats)
+    batches = batched(rows, batch_size)
+    if with_weather:
+        batches = add_weather(batches, latitude, longitude, stats)
+    for batch in batches:
+        stats['written'] += store.upsert_usage(batch, batch_size, with_weather, account)
+        batch_latest = max(row[5] for row in batch)
+        stats['latest'] = max(stats['latest'], batch_latest) if stats['latest'] else batch_latest
+
+    logging.info(f"Wrote {stats['written']} rows for {start_date} to {end_date} "
+                 f"(skipped {stats['out_of_range']} out of range, {stats['invalid']} invalid, "
+                 f"{stats['already_stored']} already stored)")
+    if with_weather:
+        logging.info(f"{stats['without_weather']} rows written without weather")
+    return stats
@@ -0,0 +1,155 @@
+"""
+Long-running collector that keeps srp within hours of real time
+
+Instead of re-requesting the whole previous day once a night, the daemon polls
+SRP and Open-Meteo on their own jittered schedules. Each poll starts from a
+per-source watermark read from storage (the newest stored hour, and the newest
+hour with weather), fetches only hours after it and writes them in small batches.
+"""
+from datetime import datetime, timedelta
+from srpenergy.client import SrpEnergyClient
+import argparse
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from dotenv import load_dotenv
+from srp_collect import collect_usage
+import metrics
+import srp_db
+import storage
+from srp_multi import load_sites
+from weather import DEFAULT_LATITUDE, DEFAULT_LONGITUDE, update_weather_data
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('srp_data_collection.log'),
+        logging.StreamHandler()
+    ]
+)
+
+load_dotenv()
+
+# Minutes between polls of each source; the weather archive lags usage by days, so it is polled less often
+USAGE_POLL_MINUTES = float(os.getenv('SRP_POLL_USAGE_MINUTES', '60'))
+WEATHER_POLL_MINUTES = float(os.getenv('SRP_POLL_WEATHER_MINUTES', '180'))
+
+# Each wait is stretched or shrunk by up to this fraction, so hosts and sources do not poll in lockstep
+POLL_JITTER = float(os.getenv('SRP_POLL_JITTER', '0.1'))
+
+# Rows per write; a poll usually brings in only a few hours, so each lands as soon as it is fetched
+DAEMON_BATCH_SIZE = 48
+
+# With nothing stored yet for an account, the first poll reaches this many days back
+INITIAL_DAYS = 1
+
+
+def jittered(seconds, jitter=POLL_JITTER):
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+
+def poll_usage(site, batch_size=DAEMON_BATCH_SIZE):
+    """Write one account's SRP hours newer than its usage watermark; returns the new watermark"""
+    with storage.open_storage() as store:
+        usage_mark, _ = store.watermarks(site['account'])
+        today = datetime.now().date()
+        # SRP is queried by whole days, so the watermark's own day is requested again and its stored hours dropped
+        start = usage_mark.date() if usage_mark else today - timedelta(days=INITIAL_DAYS)
+        client = SrpEnergyClient(site['account'], site['username'], site['password'])
+        stats = collect_usage(client, store, start, today, batch_size, account=site['account'], after=usage_mark)
+    return stats['latest'] or usage_mark
+
+
+def poll_weather(site):
+    """Fill weather for one account's hours newer than its weather watermark; returns the new watermark"""
+    with storage.open_storage() as store:
+        usage_mark, weather_mark = store.watermarks(site['account'])
+    if usage_mark is None or weather_mark and weather_mark >= usage_mark:
+        return weather_mark
+    latest = update_weather_data(account=site['account'], latitude=site['latitude'], longitude=site['longitude'],
+                                 since=weather_mark)
+    return latest or weather_mark
+
+
+def run(sites, usage_minutes=USAGE_POLL_MINUTES, weather_minutes=WEATHER_POLL_MINUTES,
+        batch_size=DAEMON_BATCH_SIZE, stop=None, once=False):
+    """
+    Poll every site until stop is set (or after one round of each source with once)
+    One account failing a poll is logged and retried at the next poll
+    """
+    stop = stop or threading.Event()
+    sources = {
+        'usage': (usage_minutes * 60, lambda site: poll_usage(site, batch_size)),
+        'weather': (weather_minutes * 60, poll_weather),
+    }
+    # Usage first, so the first weather poll sees the hours just written
+    next_poll = {'usage': time.monotonic(), 'weather': time.monotonic()}
+    polled = set()
+
+    while not stop.is_set():
+        source = min(next_poll, key=next_poll.get)
+        if stop.wait(max(0.0, next_poll[source] - time.monotonic())):
+            break
+
+        interval, poll = sources[source]
+        for site in sites:
+            try:
+                with metrics.timer(f'poll_{source}', account=site['account']):
+                    watermark = poll(site)
+                logging.info(f"{site['name']}: {source} stored through {watermark}")
+            except Exception as e:
+                metrics.incr(f'poll_{source}_errors')
+                logging.error(f"{site['name']}: {source} poll failed: {e}")
+        metrics.flush('daemon')
+
+        polled.add(source)
+        if once and polled == set(sources):
+            break
+        next_poll[source] = time.monotonic() + jittered(interval)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Poll SRP usage and Open-Meteo weather continuously, fetching only hours not yet stored"
+    )
+    parser.add_argument('--config', help="Sites config to poll every account in (see srp_multi.py)")
+    parser.add_argument('--account', default=srp_db.DEFAULT_ACCOUNT,
+                        help="SRP account to poll without --config (default SRP_ACCOUNT)")
+    parser.add_argument('--latitude', type=float, default=DEFAULT_LATITUDE, help="Weather location latitude")
+    parser.add_argument('--longitude', type=float, default=DEFAULT_LONGITUDE, help="Weather location longitude")
+    parser.add_argument('--usage-interval', type=float, default=USAGE_POLL_MINUTES,
+                        help="Minutes between SRP polls (default 60)")
+    parser.add_argument('--weather-interval', type=float, default=WEATHER_POLL_MINUTES,
+                        help="Minutes between weather polls (default 180)")
+    parser.add_argument('--batch-size', type=int, default=DAEMON_BATCH_SIZE, help="Rows per database write")
+    parser.add_argument('--once', action='store_true', help="Poll each source once and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.config:
+        sites = load_sites(args.config)
+    else:
+        sites = [{'account': args.account, 'name': args.account,
+                  'username': os.getenv('SRP_USER'), 'password': os.getenv('SRP_PASS'),
+                  'latitude': args.latitude, 'longitude': args.longitude}]
+
+    # SIGTERM (systemd, docker stop) ends the current poll and exits cleanly
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    logging.info(f"Polling {len(sites)} accounts: usage every {args.usage_interval:g} min, "
+                 f"weather every {args.weather_interval:g} min")
+    run(sites, args.usage_interval, args.weather_interval, args.batch_size, stop, args.once)
+    logging.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import mysql.connector
+import mysql.connector.pooling
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connections kept open and shared by every script and worker in the process
+POOL_SIZE = int(os.getenv('SRP_DB_POOL_SIZE', '5'))
+
+# Rows pulled per fetchmany when streaming a large SELECT
+STREAM_BATCH_SIZE = int(os.getenv('SRP_DB_STREAM_BATCH_SIZE', '10000'))
+
+# Seconds to wait for a free pooled connection before giving up
+POOL_TIMEOUT = 30
+
+# SRP account that rows are read and written under when a caller does not name one
+DEFAULT_ACCOUNT = os.getenv('SRP_ACCOUNT', '')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Create the process-wide connection pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name='srp',
+                pool_size=POOL_SIZE,
+                host=os.getenv('BI_HOST'),
+                user=os.getenv('BI_USER'),
+                password=os.getenv('BI_PASS'),
+                port=3306,
+                database=os.getenv('GEN_DB_NAME'),
+                # Plain cursors are buffered; stream() opts out explicitly
+                buffered=True
+            )
+        return _pool
+
+
+def connect(timeout=POOL_TIMEOUT):
+    """
+    Borrow a connection from the pool, waiting up to timeout seconds for one to free up
+    Closing the connection returns it to the pool
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_pool().get_connection()
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a with block"""
+    conn = connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(conn):
+    """Commit the with block's work on success, roll it back on any error"""
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def stream(conn, query, params=(), batch_size=STREAM_BATCH_SIZE):
+    """
+    Run a SELECT on an unbuffered cursor and yield its rows in lists of batch_size,
+    so large scans never hold the whole result set in memory
+    """
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from srpenergy.client import SrpEnergyClient
+import argparse
+import json
+import logging
+import os
+from dotenv import load_dotenv
+from srp_collect import collect_usage
+import metrics
+import srp_db
+import storage
+from srp_writer import WRITE_BATCH_SIZE
+from weather import DEFAULT_LATITUDE, DEFAULT_LONGITUDE, update_weather_data
+
+load_dotenv()
+
+# Accounts and locations to collect; see sites.example.json
+SITES_CONFIG = os.getenv('SRP_SITES_CONFIG', 'sites.json')
+
+# Accounts collected at the same time; each holds one pooled connection while it writes
+DEFAULT_PARALLEL = min(2, srp_db.POOL_SIZE)
+
+
+def load_sites(path=SITES_CONFIG):
+    """
+    Read the sites config and return one dict per account with its credentials and coordinates
+    Credentials are read from the environment variables the config names, never from the file
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    locations = config.get('locations', {})
+    sites = []
+    for entry in config['accounts']:
+        # Accounts without a location use the default coordinates
+        location = locations[entry['location']] if 'location' in entry else {}
+        sites.append({
+            'account': str(entry['account']),
+            'name': entry.get('name', str(entry['account'])),
+            'username': os.getenv(entry.get('username_env', 'SRP_USER')),
+            'password': os.getenv(entry.get('password_env', 'SRP_PASS')),
+            'latitude': round(float(location.get('latitude', DEFAULT_LATITUDE)), 4),
+            'longitude': round(float(location.get('longitude', DEFAULT_LONGITUDE)), 4),
+        })
+    return sites
+
+
+def collect_site(site, start_date, end_date, batch_size=WRITE_BATCH_SIZE, repair_weather=True):
+    """Collect one account's usage with weather joined in, then fill weather still missing for it"""
+    client = SrpEnergyClient(site['account'], site['username'], site['password'])
+    with metrics.timer('site_total', account=site['account']):
+        with storage.open_storage() as store:
+            stats = collect_usage(client, store, start_date, end_date, batch_size, with_weather=True,
+                                  latitude=site['latitude'], longitude=site['longitude'], account=site['account'])
+        if repair_weather:
+            update_weather_data(account=site['account'], latitude=site['latitude'], longitude=site['longitude'])
+    return stats
+
+
+def run_sites(sites, start_date, end_date, parallel=DEFAULT_PARALLEL, batch_size=WRITE_BATCH_SIZE,
+              repair_weather=True):
+    """
+    Collect every site on a bounded thread pool; one site failing does not stop the others
+    Sites at the same coordinates share weather tiles, so each month is fetched once per location
+    Returns {site name: stats dict or the exception raised}
+    """
+    def run(site):
+        try:
+            return collect_site(site, start_date, end_date, batch_size, repair_weather)
+        except Exception as e:
+            logging.error(f"{site['name']} ({site['account']}) failed: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='site') as executor:
+        results = list(executor.map(run, sites))
+    return {site['name']: result for site, result in zip(sites, results)}
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Collect SRP hourly usage and weather for every account in a sites config, concurrently"
+    )
+    parser.add_argument('--config', default=SITES_CONFIG, help="Sites config file (default sites.json)")
+    parser.add_argument('--start', type=parse_date, help="First date to collect (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_date, help="Last date to collect (YYYY-MM-DD); defaults to today")
+    parser.add_argument('--days', type=int, default=1,
+                        help="Without --start, collect this many days back from --end (default 1)")
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL, help="Accounts collected at once")
+    parser.add_argument('--batch-size', type=int, default=WRITE_BATCH_SIZE, help="Rows per database write")
+    parser.add_argument('--no-weather-repair', action='store_true',
+                        help="Skip filling weather for older rows that are still missing it")
+    args = parser.parse_args()
+
+    args.end = args.end or datetime.now().date()
+    args.start = args.start or args.end - timedelta(days=args.days)
+    if args.start > args.end:
+        parser.error("--start must not be after --end")
+    if storage.STORAGE_BACKEND == 'mysql' and args.parallel > srp_db.POOL_SIZE:
+        parser.error(f"--parallel must not exceed SRP_DB_POOL_SIZE ({srp_db.POOL_SIZE})")
+    return args
+
+
+def main():
+    # Configured here rather than on import, since srp_daemon imports this module
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('srp_data_collection.log'),
+            logging.StreamHandler()
+        ]
+    )
+    args = parse_args()
+    sites = load_sites(args.config)
+    logging.info(f"Collecting {len(sites)} accounts at {len({(s['latitude'], s['longitude']) for s in sites})} "
+                 f"locations, {args.parallel} at a time")
+
+    try:
+        with metrics.timer('multi_total', start=args.start, end=args.end, sites=len(sites)):
+            results = run_sites(sites, args.start, args.end, args.parallel, args.batch_size,
+                                repair_weather=not args.no_weather_repair)
+    finally:
+        metrics.flush('multi')
+
+    failed = [name for name, result in results.items() if isinstance(result, Exception)]
+    for name, result in results.items():
+        if not isinstance(result, Exception):
+            logging.info(f"{name}: {result['written']} rows written, {result['without_weather']} without weather")
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(results)} accounts failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+import hour_coverage
+import metrics
+import rollups
+import srp_db
+
+load_dotenv()
+
+# Rows sent to MySQL per executemany round trip
+WRITE_BATCH_SIZE = int(os.getenv('SRP_WRITE_BATCH_SIZE', '500'))
+
+# Relies on the uq_srp_account_datetime key from migrations/004_srp_account.py,
+# so writing an hour that already exists for the account refreshes it instead of duplicating it
+UPSERT_USAGE_QUERY = """
+INSERT INTO srp (account, date, hour, isotime, kwh, cost, datetime)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    date = VALUES(date),
+    hour = VALUES(hour),
+    isotime = VALUES(isotime),
+    kwh = VALUES(kwh),
+    cost = VALUES(cost)
+"""
+
+# Same as above for rows that already carry weather; a NULL reading never
+# overwrites one that is already stored
+UPSERT_USAGE_WEATHER_QUERY = """
+INSERT INTO srp (account, date, hour, isotime, kwh, cost, datetime, temperature, humidity)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    date = VALUES(date),
+    hour = VALUES(hour),
+    isotime = VALUES(isotime),
+    kwh = VALUES(kwh),
+    cost = VALUES(cost),
+    temperature = COALESCE(VALUES(temperature), temperature),
+    humidity = COALESCE(VALUES(humidity), humidity)
+"""
+
+
+def parse_usage_row(row):
+    """
+    Convert an SRP usage tuple into the (date, hour, isotime, kwh, cost, datetime) row stored in srp
+    date and hour are taken from the parsed timestamp to match the typed DATE/SMALLINT columns
+    """
+    date_val, hour_val, isodate_val, kwh_val, cost_val = row
+    format_time = datetime.strptime(isodate_val, '%Y-%m-%dT%H:%M:%S')
+    return (format_time.date(), format_time.hour, isodate_val, kwh_val, cost_val, format_time)
+
+
+def upsert_usage(conn, rows, batch_size=WRITE_BATCH_SIZE, with_weather=False, account=None):
+    """
+    Insert or refresh parsed usage rows in batches of batch_size, one
+    executemany round trip and commit per batch, then mark the hours in the
+    coverage index and refresh the rollups of the days they touch
+    With with_weather, rows carry temperature and humidity as two extra fields
+    Rows are stored under account, or SRP_ACCOUNT when it is not given
+    Returns the number of rows written
+    """
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    query = UPSERT_USAGE_WEATHER_QUERY if with_weather else UPSERT_USAGE_QUERY
+    cursor = conn.cursor()
+    written = 0
+    try:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            with metrics.timer('db_batch_commit', rows=len(batch)):
+                cursor.executemany(query, [(account,) + tuple(row) for row in batch])
+                conn.commit()
+            metrics.incr('rows_written', len(batch))
+            hour_coverage.mark([row[5] for row in batch], hour_coverage.account_dir(account))
+            written += len(batch)
+    finally:
+        cursor.close()
+    rollups.refresh_days(conn, {row[0] for row in rows}, account)
+    return written
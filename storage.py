@@ -0,0 +1,453 @@
+"""
+Storage backends for the collection scripts
+
+MySQLStorage runs against the shared MySQL server through the srp_db pool.
+SQLiteStorage keeps the same tables in a local SQLite file (WAL mode, one
+transaction per write batch), so a single-host install needs no database
+server at all. The gap finder, the usage writer and the weather updater talk to
+a backend only through the methods below; open_storage() picks one from
+SRP_STORAGE.
+"""
+from datetime import date, datetime, timedelta
+import os
+import sqlite3
+from dotenv import load_dotenv
+import hour_coverage
+import metrics
+import rollups
+import srp_db
+import srp_writer
+
+load_dotenv()
+
+# 'mysql' (default) or 'sqlite'
+STORAGE_BACKEND = os.getenv('SRP_STORAGE', 'mysql')
+
+# Database file used by the SQLite backend
+SQLITE_PATH = os.getenv('SRP_SQLITE_PATH', 'srp.sqlite')
+
+# Sentinel hours just outside the range make leading and trailing gaps show up as ordinary LEAD() jumps
+MYSQL_GAP_QUERY = """
+SELECT hour_start + INTERVAL 1 HOUR AS gap_start,
+       next_hour - INTERVAL 1 HOUR AS gap_end
+FROM (
+    SELECT hour_start, LEAD(hour_start) OVER (ORDER BY hour_start) AS next_hour
+    FROM (
+        SELECT CAST(%s AS DATETIME) AS hour_start
+        UNION
+        SELECT CAST(%s AS DATETIME)
+        UNION
+        SELECT TIMESTAMP(DATE(datetime), MAKETIME(HOUR(datetime), 0, 0))
+        FROM srp
+        WHERE account = %s AND datetime >= %s AND datetime < %s
+    ) AS hours
+) AS bounds
+WHERE next_hour > hour_start + INTERVAL 1 HOUR
+ORDER BY gap_start
+"""
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS srp (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    date TEXT,
+    hour INTEGER,
+    kwh REAL,
+    cost REAL,
+    isotime TEXT,
+    datetime TEXT,
+    temperature REAL,
+    humidity REAL,
+    weather_missing INTEGER GENERATED ALWAYS AS (temperature IS NULL OR humidity IS NULL) STORED
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_srp_account_datetime ON srp (account, datetime);
+CREATE INDEX IF NOT EXISTS idx_srp_weather_missing ON srp (account, weather_missing, id, datetime);
+CREATE INDEX IF NOT EXISTS idx_srp_updated_at ON srp (updated_at);
+
+CREATE TABLE IF NOT EXISTS srp_daily (
+    account TEXT NOT NULL DEFAULT '',
+    day TEXT NOT NULL,
+    kwh REAL,
+    cost REAL,
+    peak_hour TEXT,
+    peak_kwh REAL,
+    temp_min REAL,
+    temp_max REAL,
+    temp_avg REAL,
+    temp_hours INTEGER NOT NULL DEFAULT 0,
+    hour_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account, day)
+);
+
+CREATE TABLE IF NOT EXISTS srp_monthly (
+    account TEXT NOT NULL DEFAULT '',
+    month TEXT NOT NULL,
+    kwh REAL,
+    cost REAL,
+    peak_hour TEXT,
+    peak_kwh REAL,
+    temp_min REAL,
+    temp_max REAL,
+    temp_avg REAL,
+    temp_hours INTEGER NOT NULL DEFAULT 0,
+    hour_count INTEGER NOT NULL DEFAULT 0,
+    expected_hours INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account, month)
+);
+"""
+
+# SQLite renderings of the srp_writer upserts; updated_at is maintained by hand
+SQLITE_UPSERT_USAGE_QUERY = """
+INSERT INTO srp (account, date, hour, isotime, kwh, cost, datetime)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, datetime) DO UPDATE SET
+    date = excluded.date,
+    hour = excluded.hour,
+    isotime = excluded.isotime,
+    kwh = excluded.kwh,
+    cost = excluded.cost,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+SQLITE_UPSERT_USAGE_WEATHER_QUERY = """
+INSERT INTO srp (account, date, hour, isotime, kwh, cost, datetime, temperature, humidity)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, datetime) DO UPDATE SET
+    date = excluded.date,
+    hour = excluded.hour,
+    isotime = excluded.isotime,
+    kwh = excluded.kwh,
+    cost = excluded.cost,
+    temperature = COALESCE(excluded.temperature, temperature),
+    humidity = COALESCE(excluded.humidity, humidity),
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+SQLITE_GAP_QUERY = """
+SELECT datetime(hour_start, '+1 hour'), datetime(next_hour, '-1 hour')
+FROM (
+    SELECT hour_start, LEAD(hour_start) OVER (ORDER BY hour_start) AS next_hour
+    FROM (
+        SELECT ? AS hour_start
+        UNION
+        SELECT ?
+        UNION
+        SELECT strftime('%Y-%m-%d %H:00:00', datetime) FROM srp WHERE account = ? AND datetime >= ? AND datetime < ?
+    )
+)
+WHERE next_hour > datetime(hour_start, '+1 hour')
+ORDER BY 1
+"""
+
+SQLITE_REFRESH_DAILY_QUERY = """
+INSERT INTO srp_daily (account, day, kwh, cost, peak_hour, peak_kwh, temp_min, temp_max, temp_avg, temp_hours, hour_count)
+SELECT ?, d.day, d.kwh, d.cost, p.datetime, p.kwh, d.temp_min, d.temp_max, d.temp_avg, d.temp_hours, d.hour_count
+FROM (
+    SELECT date(datetime) AS day,
+           SUM(kwh) AS kwh,
+           SUM(cost) AS cost,
+           MIN(temperature) AS temp_min,
+           MAX(temperature) AS temp_max,
+           AVG(temperature) AS temp_avg,
+           COUNT(temperature) AS temp_hours,
+           COUNT(DISTINCT strftime('%H', datetime)) AS hour_count
+    FROM srp
+    WHERE account = ? AND datetime >= ? AND datetime < ?
+    GROUP BY date(datetime)
+) AS d
+JOIN (
+    SELECT date(datetime) AS day, datetime, kwh,
+           ROW_NUMBER() OVER (PARTITION BY date(datetime) ORDER BY kwh DESC, datetime) AS rn
+    FROM srp
+    WHERE account = ? AND datetime >= ? AND datetime < ?
+) AS p ON p.day = d.day AND p.rn = 1
+"""
+
+SQLITE_REFRESH_MONTHLY_QUERY = """
+INSERT INTO srp_monthly (account, month, kwh, cost, peak_hour, peak_kwh, temp_min, temp_max, temp_avg,
+                         temp_hours, hour_count, expected_hours)
+SELECT ?, m.month, m.kwh, m.cost, p.peak_hour, p.peak_kwh, m.temp_min, m.temp_max, m.temp_avg,
+       m.temp_hours, m.hour_count, CAST(strftime('%d', m.month, '+1 month', '-1 day') AS INTEGER) * 24
+FROM (
+    SELECT strftime('%Y-%m-01', day) AS month,
+           SUM(kwh) AS kwh,
+           SUM(cost) AS cost,
+           MIN(temp_min) AS temp_min,
+           MAX(temp_max) AS temp_max,
+           SUM(temp_avg * temp_hours) / NULLIF(SUM(temp_hours), 0) AS temp_avg,
+           SUM(temp_hours) AS temp_hours,
+           SUM(hour_count) AS hour_count
+    FROM srp_daily
+    WHERE account = ? AND day >= ? AND day < ?
+    GROUP BY month
+) AS m
+JOIN (
+    SELECT strftime('%Y-%m-01', day) AS month, peak_hour, peak_kwh,
+           ROW_NUMBER() OVER (PARTITION BY strftime('%Y-%m-01', day) ORDER BY peak_kwh DESC, peak_hour) AS rn
+    FROM srp_daily
+    WHERE account = ? AND day >= ? AND day < ?
+) AS p ON p.month = m.month AND p.rn = 1
+"""
+
+
+def _account(account):
+    return srp_db.DEFAULT_ACCOUNT if account is None else account
+
+
+def _hour_bounds(start_date, end_date):
+    """Return the first hour of start_date and the first hour after end_date"""
+    return (datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.min.time()) + timedelta(days=1))
+
+
+class MySQLStorage:
+    """srp on the shared MySQL server, through one pooled connection"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or srp_db.connect()
+        self._staging_ready = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def date_range(self, account=None):
+        """Return the (first, last) dates stored for account, or (None, None)"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT DATE(MIN(datetime)), DATE(MAX(datetime)) FROM srp WHERE account = %s",
+                       (_account(account),))
+        first, last = cursor.fetchone()
+        cursor.close()
+        return first, last
+
+    def find_missing_ranges(self, start_date, end_date, account=None):
+        """Return inclusive (gap_start, gap_end) hour datetimes missing between start_date and end_date"""
+        range_start, range_end = _hour_bounds(start_date, end_date)
+        cursor = self.conn.cursor()
+        cursor.execute(MYSQL_GAP_QUERY, (range_start - timedelta(hours=1), range_end,
+                                         _account(account), range_start, range_end))
+        ranges = list(cursor.fetchall())
+        cursor.close()
+        return ranges
+
+    def watermarks(self, account=None):
+        """Return (newest stored hour, newest hour with weather) for account; either may be None"""
+        # Both walk uq_srp_account_datetime backwards from the newest hour; only
+        # the few recent rows still waiting for weather are passed over
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(datetime) FROM srp WHERE account = %s", (_account(account),))
+        usage = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT datetime FROM srp FORCE INDEX (uq_srp_account_datetime)
+            WHERE account = %s AND weather_missing = 0
+            ORDER BY datetime DESC
+            LIMIT 1
+        """, (_account(account),))
+        row = cursor.fetchone()
+        cursor.close()
+        return usage, row[0] if row else None
+
+    def upsert_usage(self, rows, batch_size=srp_writer.WRITE_BATCH_SIZE, with_weather=False, account=None):
+        return srp_writer.upsert_usage(self.conn, rows, batch_size, with_weather, _account(account))
+
+    def missing_weather_page(self, after_id, limit, account=None, since=None):
+        """
+        Return up to limit (id, datetime) rows of account still missing weather, with id above after_id
+        and, when since is given, datetime after it
+        """
+        # (account, weather_missing) is indexed with (id, datetime), so each page is an index range scan
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, datetime
+            FROM srp
+            WHERE account = %s AND weather_missing = 1 AND id > %s
+              AND (%s IS NULL OR datetime > %s)
+            ORDER BY id
+            LIMIT %s
+        """, (_account(account), after_id, since, since, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def apply_weather(self, updates, batch_size):
+        """
+        Load (id, temperature, humidity) tuples into a session-scoped staging table
+        in batches and apply them to srp with a single joined UPDATE
+        Returns the number of rows updated
+        """
+        if not updates:
+            return 0
+        cursor = self.conn.cursor()
+        if not self._staging_ready:
+            cursor.execute("""
+                CREATE TEMPORARY TABLE IF NOT EXISTS srp_weather_staging (
+                    id INT NOT NULL PRIMARY KEY,
+                    temperature DOUBLE NOT NULL,
+                    humidity DOUBLE NOT NULL
+                ) ENGINE=InnoDB
+            """)
+            self._staging_ready = True
+        cursor.execute("TRUNCATE TABLE srp_weather_staging")
+
+        insert_query = "INSERT INTO srp_weather_staging (id, temperature, humidity) VALUES (%s, %s, %s)"
+        for i in range(0, len(updates), batch_size):
+            cursor.executemany(insert_query, updates[i:i + batch_size])
+
+        cursor.execute("""
+            UPDATE srp AS s
+            JOIN srp_weather_staging AS w ON w.id = s.id
+            SET s.temperature = w.temperature, s.humidity = w.humidity
+        """)
+        updated = cursor.rowcount
+        self.conn.commit()
+        cursor.close()
+        return updated
+
+    def refresh_rollups(self, days, account=None):
+        rollups.refresh_days(self.conn, days, _account(account))
+
+    def close(self):
+        """Return the connection to the pool"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+
+class SQLiteStorage:
+    """srp in a local SQLite file; datetimes are stored as 'YYYY-MM-DD HH:MM:SS' text"""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        # WAL lets readers run alongside the writer; NORMAL sync is durable at each commit in WAL mode
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def date_range(self, account=None):
+        """Return the (first, last) dates stored for account, or (None, None)"""
+        first, last = self.conn.execute(
+            "SELECT date(MIN(datetime)), date(MAX(datetime)) FROM srp WHERE account = ?", (_account(account),)
+        ).fetchone()
+        if first is None:
+            return None, None
+        return date.fromisoformat(first), date.fromisoformat(last)
+
+    def find_missing_ranges(self, start_date, end_date, account=None):
+        """Return inclusive (gap_start, gap_end) hour datetimes missing between start_date and end_date"""
+        range_start, range_end = _hour_bounds(start_date, end_date)
+        rows = self.conn.execute(SQLITE_GAP_QUERY, (
+            str(range_start - timedelta(hours=1)), str(range_end),
+            _account(account), str(range_start), str(range_end)
+        )).fetchall()
+        return [(datetime.fromisoformat(start), datetime.fromisoformat(end)) for start, end in rows]
+
+    def watermarks(self, account=None):
+        """Return (newest stored hour, newest hour with weather) for account; either may be None"""
+        usage, = self.conn.execute("SELECT MAX(datetime) FROM srp WHERE account = ?", (_account(account),)).fetchone()
+        row = self.conn.execute("""
+            SELECT datetime FROM srp INDEXED BY uq_srp_account_datetime
+            WHERE account = ? AND weather_missing = 0
+            ORDER BY datetime DESC
+            LIMIT 1
+        """, (_account(account),)).fetchone()
+        weather = row[0] if row else None
+        return tuple(datetime.fromisoformat(moment) if moment else None for moment in (usage, weather))
+
+    def upsert_usage(self, rows, batch_size=srp_writer.WRITE_BATCH_SIZE, with_weather=False, account=None):
+        """
+        Insert or refresh parsed usage rows, one transaction per batch of batch_size,
+        then mark the hours in the coverage index and refresh the rollups of the days they touch
+        Returns the number of rows written
+        """
+        account = _account(account)
+        query = SQLITE_UPSERT_USAGE_WEATHER_QUERY if with_weather else SQLITE_UPSERT_USAGE_QUERY
+        written = 0
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            with metrics.timer('db_batch_commit', rows=len(batch)):
+                with self.conn:
+                    self.conn.executemany(query, [
+                        (account, str(day), hour, isotime, kwh, cost, str(moment), *weather)
+                        for day, hour, isotime, kwh, cost, moment, *weather in batch
+                    ])
+            metrics.incr('rows_written', len(batch))
+            hour_coverage.mark([row[5] for row in batch], hour_coverage.account_dir(account))
+            written += len(batch)
+        self.refresh_rollups({row[0] for row in rows}, account)
+        return written
+
+    def missing_weather_page(self, after_id, limit, account=None, since=None):
+        """
+        Return up to limit (id, datetime) rows of account still missing weather, with id above after_id
+        and, when since is given, datetime after it
+        """
+        since = None if since is None else str(since)
+        rows = self.conn.execute("""
+            SELECT id, datetime
+            FROM srp
+            WHERE account = ? AND weather_missing = 1 AND id > ?
+              AND (? IS NULL OR datetime > ?)
+            ORDER BY id
+            LIMIT ?
+        """, (_account(account), after_id, since, since, limit)).fetchall()
+        return [(row_id, datetime.fromisoformat(moment) if moment else None) for row_id, moment in rows]
+
+    def apply_weather(self, updates, batch_size):
+        """Apply (id, temperature, humidity) tuples in one transaction; returns the number of rows updated"""
+        if not updates:
+            return 0
+        with self.conn:
+            cursor = self.conn.executemany(
+                "UPDATE srp SET temperature = ?, humidity = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(temperature, humidity, row_id) for row_id, temperature, humidity in updates]
+            )
+        return cursor.rowcount
+
+    def refresh_rollups(self, days, account=None):
+        """Recompute an account's daily rollups for the given dates and the monthly rollups of their months"""
+        account = _account(account)
+        days = {day.date() if isinstance(day, datetime) else day for day in days if day is not None}
+        if not days:
+            return
+
+        with metrics.timer('rollup_refresh', days=len(days)), self.conn:
+            for first, last in rollups.contiguous_ranges(days):
+                start, end = (str(moment) for moment in _hour_bounds(first, last))
+                self.conn.execute("DELETE FROM srp_daily WHERE account = ? AND day >= ? AND day <= ?",
+                                  (account, str(first), str(last)))
+                self.conn.execute(SQLITE_REFRESH_DAILY_QUERY, (account, account, start, end, account, start, end))
+
+            for month in sorted({rollups.month_start(day) for day in days}):
+                end = str(rollups.next_month(month))
+                self.conn.execute("DELETE FROM srp_monthly WHERE account = ? AND month = ?", (account, str(month)))
+                self.conn.execute(SQLITE_REFRESH_MONTHLY_QUERY,
+                                  (account, account, str(month), end, account, str(month), end))
+        metrics.incr('rollup_days_refreshed', len(days))
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+
+def open_storage(backend=None):
+    """Open the configured backend (SRP_STORAGE); use it in a with block or close() it"""
+    backend = backend or STORAGE_BACKEND
+    if backend == 'mysql':
+        return MySQLStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage()
+    raise ValueError(f"Unknown SRP_STORAGE backend {backend!r}; expected 'mysql' or 'sqlite'")
@@ -0,0 +1,86 @@
+from datetime import date, datetime, timedelta
+import pytest
+import backfill
+import hour_coverage
+import storage
+from backfill_journal import BackfillJournal, COMPLETED, EMPTY, EMPTY_RUNS, FAILED
+
+
+class FakeSrpClient:
+    """Serves every hour of the requested days except those in withheld; empty=True answers nothing"""
+
+    def __init__(self, withheld=(), empty=False):
+        self.withheld = set(withheld)
+        self.empty = empty
+
+    def usage(self, startdate, enddate, is_tou=False):
+        if self.empty:
+            return []
+        rows = []
+        day = startdate.date()
+        while day <= enddate.date():
+            for hour in range(24):
+                moment = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+                if moment not in self.withheld:
+                    rows.append(('', '', moment.strftime('%Y-%m-%dT%H:%M:%S'), '1.0', '0.1'))
+            day += timedelta(days=1)
+        return rows
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(hour_coverage, 'INDEX_DIR', str(tmp_path / 'coverage'))
+    monkeypatch.setattr(storage, 'open_storage', lambda: storage.SQLiteStorage(str(tmp_path / 'srp.sqlite')))
+    manager = backfill.SrpDataManager(account='test')
+    yield manager
+    manager.close_connection()
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = BackfillJournal(str(tmp_path / 'journal.sqlite'))
+    yield journal
+    journal.close()
+
+
+def statuses(journal):
+    return {day: (status, empty_count) for day, status, empty_count
+            in journal.conn.execute("SELECT day, status, empty_count FROM backfill_days")}
+
+
+def run(manager, journal, client):
+    manager.get_srp_client = lambda: client
+    missing = manager.storage.find_missing_ranges(date(2025, 1, 1), date(2025, 1, 2), 'test')
+    manager.fetch_missing_data(missing, journal=journal)
+
+
+def test_partial_day_is_retried_until_every_hour_is_written(manager, journal):
+    unpublished = [datetime(2025, 1, 2, hour) for hour in range(20, 24)]
+    run(manager, journal, FakeSrpClient(withheld=unpublished))
+
+    assert statuses(journal) == {'2025-01-01': (COMPLETED, 0), '2025-01-02': (FAILED, 0)}
+    assert journal.skip_dates() == {date(2025, 1, 1)}
+
+    run(manager, journal, FakeSrpClient())
+    assert statuses(journal)['2025-01-02'] == (COMPLETED, 0)
+    assert manager.storage.find_missing_ranges(date(2025, 1, 1), date(2025, 1, 2), 'test') == []
+
+
+def test_transient_empty_window_is_retried(manager, journal):
+    run(manager, journal, FakeSrpClient(empty=True))
+
+    assert statuses(journal) == {'2025-01-01': (EMPTY, 1), '2025-01-02': (EMPTY, 1)}
+    assert journal.skip_dates() == set()
+
+    run(manager, journal, FakeSrpClient())
+    assert statuses(journal) == {'2025-01-01': (COMPLETED, 0), '2025-01-02': (COMPLETED, 0)}
+
+
+def test_day_missing_from_a_response_is_skipped_only_after_repeated_empty_runs(manager, journal):
+    absent = [datetime(2025, 1, 2, hour) for hour in range(24)]
+    for run_number in range(1, EMPTY_RUNS + 1):
+        assert date(2025, 1, 2) not in journal.skip_dates()
+        run(manager, journal, FakeSrpClient(withheld=absent))
+        assert statuses(journal)['2025-01-02'] == (EMPTY, run_number)
+
+    assert journal.skip_dates() == {date(2025, 1, 1), date(2025, 1, 2)}
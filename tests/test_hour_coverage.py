@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta
+import numpy as np
+import pytest
+import hour_coverage
+import usage_cache
+
+
+def hours_between(start, end):
+    """Every hour from start to end inclusive"""
+    return [start + timedelta(hours=i) for i in range(int((end - start).total_seconds() // 3600) + 1)]
+
+
+def marked(index_dir, start, end):
+    """The hours in start..end whose bit is set"""
+    first = int(np.datetime64(start, 'h').astype(np.int64))
+    last = int(np.datetime64(end, 'h').astype(np.int64))
+    covered = hour_coverage._covered(index_dir, first, last)
+    return [start + timedelta(hours=int(i)) for i in np.nonzero(covered)[0]]
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / 'index')
+
+
+def test_empty_index_is_all_missing(index_dir):
+    assert hour_coverage.missing_ranges(date(2025, 1, 1), date(2025, 1, 2), index_dir) == [
+        (datetime(2025, 1, 1, 0), datetime(2025, 1, 2, 23))
+    ]
+    assert hour_coverage.completeness(date(2025, 1, 1), date(2025, 1, 2), index_dir) == 0.0
+    assert hour_coverage.bounds(index_dir) == (None, None)
+
+
+def test_bits_survive_a_resize_that_moves_base_hour_back(index_dir):
+    later = [datetime(2025, 3, 1, 5), datetime(2025, 3, 1, 6), datetime(2025, 3, 2, 23)]
+    hour_coverage.mark(later, index_dir)
+    base_before = hour_coverage.load_meta(index_dir)['base_hour']
+
+    # Not on a byte boundary, and more than a whole grow step earlier
+    earlier = [datetime(2023, 12, 31, 23), datetime(2024, 1, 1, 3)]
+    hour_coverage.mark(earlier, index_dir)
+    meta = hour_coverage.load_meta(index_dir)
+
+    assert meta['base_hour'] < base_before
+    assert meta['base_hour'] % 8 == 0
+    assert meta['hours'] % hour_coverage.GROW_HOURS == 0
+    assert marked(index_dir, datetime(2023, 12, 1), datetime(2025, 4, 1)) == earlier + later
+    assert hour_coverage.bounds(index_dir) == (date(2023, 12, 31), date(2025, 3, 2))
+
+
+def test_bits_survive_growth_past_the_end(index_dir):
+    hour_coverage.mark([datetime(2025, 1, 1, 0)], index_dir)
+    last = datetime(2025, 1, 1) + timedelta(hours=hour_coverage.GROW_HOURS)
+    hour_coverage.mark([last], index_dir)
+
+    assert hour_coverage.load_meta(index_dir)['hours'] == 2 * hour_coverage.GROW_HOURS
+    assert marked(index_dir, datetime(2024, 12, 31), last + timedelta(days=1)) == [datetime(2025, 1, 1, 0), last]
+
+
+def test_missing_ranges_at_day_edges(index_dir):
+    stored = hours_between(datetime(2025, 1, 1, 0), datetime(2025, 1, 3, 23))
+    gaps = {datetime(2025, 1, 1, 0), datetime(2025, 1, 1, 23), datetime(2025, 1, 2, 0), datetime(2025, 1, 3, 23)}
+    hour_coverage.mark([hour for hour in stored if hour not in gaps], index_dir)
+
+    assert hour_coverage.missing_ranges(date(2025, 1, 1), date(2025, 1, 3), index_dir) == [
+        (datetime(2025, 1, 1, 0), datetime(2025, 1, 1, 0)),
+        (datetime(2025, 1, 1, 23), datetime(2025, 1, 2, 0)),
+        (datetime(2025, 1, 3, 23), datetime(2025, 1, 3, 23)),
+    ]
+    # Days outside the stored hours are missing in full, up to and including hour 23
+    assert hour_coverage.missing_ranges(date(2025, 1, 3), date(2025, 1, 4), index_dir) == [
+        (datetime(2025, 1, 3, 23), datetime(2025, 1, 4, 23)),
+    ]
+    assert hour_coverage.missing_ranges(date(2025, 1, 2), date(2025, 1, 2), index_dir) == [
+        (datetime(2025, 1, 2, 0), datetime(2025, 1, 2, 0)),
+    ]
+    assert hour_coverage.completeness(date(2025, 1, 2), date(2025, 1, 2), index_dir) == 23 / 24
+
+
+def test_missing_ranges_match_the_array_gap_finder(index_dir):
+    rng = np.random.default_rng(0)
+    hours = np.arange(np.datetime64('2024-01-01T00', 'h'), np.datetime64('2024-03-01T00', 'h'))
+    kept = hours[rng.random(len(hours)) > 0.05]
+    hour_coverage.mark(kept, index_dir)
+
+    expected = usage_cache.find_missing_ranges(kept.astype('datetime64[s]'), date(2024, 1, 1), date(2024, 2, 29))
+    assert hour_coverage.missing_ranges(date(2024, 1, 1), date(2024, 2, 29), index_dir) == expected
@@ -0,0 +1,220 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import logging
+import os
+import time
+from dotenv import load_dotenv
+import srp_db
+
+load_dotenv()
+
+# Local columnar copy of srp: one flat binary file per column plus meta.json
+CACHE_DIR = os.getenv('SRP_CACHE_DIR', '.usage_cache')
+
+# Column name -> on-disk dtype; rows are kept sorted by id
+COLUMNS = {
+    'id': np.dtype('int64'),
+    'datetime': np.dtype('datetime64[s]'),
+    'kwh': np.dtype('float64'),
+    'cost': np.dtype('float64'),
+    'temperature': np.dtype('float32'),
+    'humidity': np.dtype('float32'),
+}
+
+# Rows pulled from the streaming cursor per fetchmany
+SYNC_BATCH_SIZE = srp_db.STREAM_BATCH_SIZE
+
+
+def _column_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.bin")
+
+
+def load_meta(cache_dir=CACHE_DIR):
+    """Return the cache metadata: row count and the updated_at/id high-watermark"""
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'updated_at': None, 'max_id': 0}
+
+
+def _save_meta(cache_dir, meta):
+    # Written last and atomically, so a crash mid-sync leaves the previous state valid
+    path = os.path.join(cache_dir, 'meta.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def _map_columns(cache_dir, rows, mode):
+    arrays = {}
+    for name, dtype in COLUMNS.items():
+        if rows:
+            arrays[name] = np.memmap(_column_path(cache_dir, name), dtype=dtype, mode=mode, shape=(rows,))
+        else:
+            arrays[name] = np.empty(0, dtype=dtype)
+    return arrays
+
+
+def load_arrays(cache_dir=CACHE_DIR):
+    """Memory-map every cached column read-only; no data is copied until it is touched"""
+    return _map_columns(cache_dir, load_meta(cache_dir)['rows'], 'r')
+
+
+def load_frame(cache_dir=CACHE_DIR):
+    """Load the cache as a DataFrame backed by the memory-mapped columns"""
+    arrays = load_arrays(cache_dir)
+    frame = pd.DataFrame({name: arrays[name] for name in COLUMNS}, copy=False)
+    frame['datetime'] = frame['datetime'].astype('datetime64[ns]')
+    return frame
+
+
+def _to_columns(rows):
+    """Convert (id, datetime, kwh, cost, temperature, humidity, updated_at) tuples into column arrays"""
+    ids, datetimes, kwhs, costs, temps, hums, _ = zip(*rows)
+
+    def as_float(values):
+        return [np.nan if v is None else float(v) for v in values]
+
+    return {
+        'id': np.array(ids, dtype=COLUMNS['id']),
+        'datetime': np.array([np.datetime64('NaT') if v is None else v for v in datetimes], dtype=COLUMNS['datetime']),
+        'kwh': np.array(as_float(kwhs), dtype=COLUMNS['kwh']),
+        'cost': np.array(as_float(costs), dtype=COLUMNS['cost']),
+        'temperature': np.array(as_float(temps), dtype=COLUMNS['temperature']),
+        'humidity': np.array(as_float(hums), dtype=COLUMNS['humidity']),
+    }
+
+
+def _append(cache_dir, rows, columns):
+    """Append columns after the first `rows` entries of each column file"""
+    for name, dtype in COLUMNS.items():
+        path = _column_path(cache_dir, name)
+        with open(path, 'ab') as f:
+            # Drop bytes left behind by an interrupted sync before appending
+            f.truncate(rows * dtype.itemsize)
+            f.write(columns[name].tobytes())
+
+
+def _rewrite(cache_dir, columns):
+    """Replace every column file with the given arrays"""
+    for name in COLUMNS:
+        path = _column_path(cache_dir, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(columns[name].tobytes())
+        os.replace(path + '.tmp', path)
+
+
+def _apply_batch(cache_dir, meta, columns):
+    """Update rows already cached in place and add the rest, keeping ids sorted"""
+    cached = _map_columns(cache_dir, meta['rows'], 'r+') if meta['rows'] else None
+
+    is_new = np.ones(len(columns['id']), dtype=bool)
+    if cached is not None:
+        positions = np.searchsorted(cached['id'], columns['id'])
+        positions = np.minimum(positions, meta['rows'] - 1)
+        found = cached['id'][positions] == columns['id']
+        for name in COLUMNS:
+            if name != 'id':
+                cached[name][positions[found]] = columns[name][found]
+                cached[name].flush()
+        is_new = ~found
+
+    if not is_new.any():
+        return
+
+    new_columns = {name: values[is_new] for name, values in columns.items()}
+    if new_columns['id'][0] > meta['max_id']:
+        _append(cache_dir, meta['rows'], new_columns)
+    else:
+        # A row committed out of id order: merge and rewrite (rare)
+        merged = {name: np.concatenate([np.asarray(cached[name]), new_columns[name]]) for name in COLUMNS}
+        order = np.argsort(merged['id'], kind='stable')
+        del cached
+        _rewrite(cache_dir, {name: values[order] for name, values in merged.items()})
+
+    meta['rows'] += int(is_new.sum())
+    meta['max_id'] = max(meta['max_id'], int(new_columns['id'].max()))
+
+
+def sync(conn, cache_dir=CACHE_DIR, full=False, batch_size=SYNC_BATCH_SIZE, account=None):
+    """
+    Bring the cache up to date with one account's srp rows, reading only rows whose
+    updated_at is at or after the stored watermark (or everything when full=True)
+    A cache holds a single account; syncing a different one rebuilds it
+    Returns the number of rows read from MySQL
+    """
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = load_meta(cache_dir)
+    if full or meta['rows'] and meta.get('account') != account:
+        meta = {'rows': 0, 'updated_at': None, 'max_id': 0}
+        _rewrite(cache_dir, {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()})
+    meta['account'] = account
+
+    query = "SELECT id, datetime, kwh, cost, temperature, humidity, updated_at FROM srp WHERE account = %s"
+    params = (account,)
+    if meta['updated_at']:
+        # >= rather than > so rows sharing the watermark second are not missed;
+        # re-applying them is harmless
+        query += " AND updated_at >= %s"
+        params += (meta['updated_at'],)
+    query += " ORDER BY id"
+
+    started = time.monotonic()
+    read = 0
+    watermark = meta['updated_at']
+    for rows in srp_db.stream(conn, query, params, batch_size):
+        _apply_batch(cache_dir, meta, _to_columns(rows))
+        latest = max(row[6] for row in rows).strftime('%Y-%m-%d %H:%M:%S')
+        watermark = max(watermark, latest) if watermark else latest
+        read += len(rows)
+
+    meta['updated_at'] = watermark
+    _save_meta(cache_dir, meta)
+    logging.info(f"Synced {read} rows into {cache_dir} in {time.monotonic() - started:.2f}s "
+                 f"({meta['rows']} cached, watermark {watermark})")
+    return read
+
+
+def find_missing_ranges(datetimes, start_date=None, end_date=None):
+    """
+    Find missing hours in an array of datetime64 values
+    Returns inclusive (gap_start, gap_end) hour datetimes between start_date and end_date
+    (defaulting to the first and last cached days), matching SrpDataManager.find_missing_ranges()
+    """
+    hours = np.unique(datetimes[~np.isnat(datetimes)].astype('datetime64[h]'))
+    if not len(hours) and (start_date is None or end_date is None):
+        return []
+
+    first = np.datetime64(start_date, 'D') if start_date else hours[0].astype('datetime64[D]')
+    last = np.datetime64(end_date, 'D') if end_date else hours[-1].astype('datetime64[D]')
+    first_hour = first.astype('datetime64[h]')
+    last_hour = last.astype('datetime64[h]') + np.timedelta64(23, 'h')
+
+    # Sentinels just outside the range turn leading and trailing gaps into ordinary jumps
+    hours = hours[(hours >= first_hour) & (hours <= last_hour)]
+    bounds = np.concatenate([[first_hour - np.timedelta64(1, 'h')], hours, [last_hour + np.timedelta64(1, 'h')]])
+    jumps = np.nonzero(np.diff(bounds) > np.timedelta64(1, 'h'))[0]
+
+    gap_starts = (bounds[jumps] + np.timedelta64(1, 'h')).astype(datetime)
+    gap_ends = (bounds[jumps + 1] - np.timedelta64(1, 'h')).astype(datetime)
+    return list(zip(gap_starts, gap_ends))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync the local columnar cache of srp hourly usage")
+    parser.add_argument('--full', action='store_true', help="Discard the cache and re-read the whole table")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Cache directory")
+    parser.add_argument('--account', default=srp_db.DEFAULT_ACCOUNT, help="SRP account to cache (default SRP_ACCOUNT)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    with srp_db.connection() as conn:
+        sync(conn, args.cache_dir, full=args.full, account=args.account)
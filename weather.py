@@ -1,31 +1,56 @@
-import os
-import mysql.connector
+import logging
+import sys
+import threading
+import time
+import numpy as np
 import openmeteo_requests
 import pandas as pd
-import requests_cache
+from concurrent.futures import ThreadPoolExecutor
 from retry_requests import retry
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import numpy as np
+import metrics
+import srp_db
+import storage
+import weather_tiles
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get database credentials from environment variables
-db_host = os.getenv('BI_HOST')
-db_user = os.getenv('BI_USER')
-db_pass = os.getenv('BI_PASS')
-db_name = os.getenv('GEN_DB_NAME')
-
-# Setup the Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
-retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
+# Setup the Open-Meteo API client with retry on error; responses are cached
+# as monthly tiles by weather_tiles rather than as raw HTTP responses
+retry_session = retry(retries = 5, backoff_factor = 0.2)
 openmeteo = openmeteo_requests.Client(session = retry_session)
 
-def fetch_weather_data(latitude, longitude, start_date, end_date):
+# Month tiles fetched from Open-Meteo concurrently when several are missing
+TILE_FETCH_WORKERS = 4
+
+# Maximum distance between a usage row and the weather observation matched to it
+WEATHER_MATCH_TOLERANCE = pd.Timedelta(hours=1)
+
+# Rows read per keyset page and rows per executemany when applying weather
+WEATHER_PAGE_SIZE = 8000
+STAGING_BATCH_SIZE = 1000
+
+# Scottsdale, Arizona coordinates
+DEFAULT_LATITUDE = 33.7591
+DEFAULT_LONGITUDE = -111.7270
+
+# Months too recent to store as tiles are kept in memory this long, so sites
+# sharing a location in one run fetch them once
+RECENT_TILE_TTL = 15 * 60
+
+# One lock per (latitude, longitude, month): concurrent requests for the same
+# tile wait for the first fetch instead of each calling Open-Meteo
+_tile_locks = {}
+_tile_locks_lock = threading.Lock()
+_recent_tiles = {}
+
+def fetch_weather_archive(latitude, longitude, start_date, end_date):
     """
     Fetch weather data from Open-Meteo API for specified coordinates and date range
-    Returns a DataFrame with date, temperature, and humidity
+    Returns (start_epoch, interval_seconds, values) with values a float32
+    array of temperature and humidity per hour
     """
     url = "https://archive-api.open-meteo.com/v1/archive"
     params = {
@@ -38,7 +63,8 @@ def fetch_weather_data(latitude, longitude, start_date, end_date):
         "temperature_unit": "fahrenheit"
     }
     
-    responses = openmeteo.weather_api(url, params=params)
+    with metrics.timer('openmeteo_api', start_date=start_date, end_date=end_date):
+        responses = openmeteo.weather_api(url, params=params)
     response = responses[0]
     
     # Process hourly data
@@ -46,157 +72,206 @@ def fetch_weather_data(latitude, longitude, start_date, end_date):
     hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
     hourly_relative_humidity_2m = hourly.Variables(1).ValuesAsNumpy()
     
-    # Get hourly time as a correct array
-    hourly_time = pd.date_range(
-        start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-        periods=len(hourly_temperature_2m),
-        freq=pd.Timedelta(seconds=hourly.Interval())
-    )
+    values = np.column_stack([hourly_temperature_2m, hourly_relative_humidity_2m]).astype(np.float32)
+    return int(hourly.Time()), int(hourly.Interval()), values
+
+def fetch_weather_tile(latitude, longitude, month):
+    """
+    Return one month of weather from the tile store, fetching and storing it on a miss
+    Only one thread fetches a given tile; others asking for it meanwhile reuse its result
+    """
+    key = (latitude, longitude, month)
+    with _tile_locks_lock:
+        lock = _tile_locks.setdefault(key, threading.Lock())
     
-    # Create DataFrame
-    hourly_data = {
-        "datetime": hourly_time,
-        "temperature": hourly_temperature_2m,
-        "humidity": hourly_relative_humidity_2m
-    }
+    with lock:
+        tile = weather_tiles.load_tile(latitude, longitude, month)
+        if tile is None:
+            fetched_at, tile = _recent_tiles.get(key, (0, None))
+            if time.monotonic() - fetched_at > RECENT_TILE_TTL:
+                tile = None
+        if tile is not None:
+            metrics.incr('weather_tiles_hit')
+            return tile
+        
+        metrics.incr('weather_tiles_fetched')
+        end_date = min(weather_tiles.month_end(month), datetime.now().date())
+        tile = fetch_weather_archive(latitude, longitude, month, end_date)
+        if weather_tiles.is_cacheable(month):
+            weather_tiles.save_tile(latitude, longitude, month, *tile)
+        else:
+            _recent_tiles[key] = (time.monotonic(), tile)
+        return tile
+
+def fetch_weather_data(latitude, longitude, start_date, end_date):
+    """
+    Fetch weather data for specified coordinates and date range, one month tile at a time
+    Only tiles missing from the local store hit Open-Meteo, in parallel
+    Returns a DataFrame with date, temperature, and humidity
+    """
+    latitude = round(latitude, 4)
+    longitude = round(longitude, 4)
+    months = [month for month in weather_tiles.months_between(start_date, end_date)
+              if month <= datetime.now().date()]
+    
+    with metrics.timer('weather_fetch', start_date=start_date, end_date=end_date, tiles=len(months)):
+        with ThreadPoolExecutor(max_workers=TILE_FETCH_WORKERS) as executor:
+            tiles = list(executor.map(lambda month: fetch_weather_tile(latitude, longitude, month), months))
+    
+    frames = []
+    for start, interval, values in tiles:
+        # Get hourly time as a correct array
+        hourly_time = pd.date_range(
+            start=pd.to_datetime(start, unit="s", utc=True),
+            periods=len(values),
+            freq=pd.Timedelta(seconds=interval)
+        )
+        frames.append(pd.DataFrame({
+            "datetime": hourly_time,
+            "temperature": values[:, 0],
+            "humidity": values[:, 1]
+        }))
+    
+    if not frames:
+        return pd.DataFrame({
+            "datetime": pd.DatetimeIndex([], tz="UTC"),
+            "temperature": np.empty(0, dtype=np.float32),
+            "humidity": np.empty(0, dtype=np.float32)
+        })
+    
+    # Trim the month tiles to the requested local dates
+    weather_df = pd.concat(frames, ignore_index=True)
+    local_dates = weather_df['datetime'].dt.tz_convert('America/Los_Angeles').dt.date
+    return weather_df[(local_dates >= start_date) & (local_dates <= end_date)].reset_index(drop=True)
+
+def fetch_local_weather(latitude, longitude, min_date, max_date):
+    """
+    Fetch hourly weather covering min_date..max_date with a buffer day on each side
+    Returns a DataFrame whose datetimes are naive local time, like srp.datetime
+    """
+    # Add a buffer day on each side to ensure we have all hours
+    start_date = min_date - timedelta(days=1)
+    end_date = max_date + timedelta(days=1)
     
-    return pd.DataFrame(data=hourly_data)
+    print(f"Fetching weather data from {start_date} to {end_date}")
+    weather_df = fetch_weather_data(latitude, longitude, start_date, end_date)
+    
+    # Convert timezone if needed - depends on your data
+    # This assumes the database datetime is in the local timezone
+    weather_df['datetime'] = weather_df['datetime'].dt.tz_convert('America/Los_Angeles')
+    weather_df['datetime'] = weather_df['datetime'].dt.tz_localize(None)
+    return weather_df
 
-def update_weather_data():
+def attach_weather(rows_df, weather_df, tolerance=WEATHER_MATCH_TOLERANCE):
+    """
+    Join each row to the nearest weather observation by timestamp
+    Expects a 'datetime' column on both frames and returns rows_df with float
+    temperature and humidity columns; rows with no observation within
+    tolerance, or with NaN readings, get NaN
+    """
+    left = rows_df.drop(columns=['temperature', 'humidity'], errors='ignore')
+    left = left.assign(datetime=left['datetime'].astype('datetime64[ns]')).sort_values('datetime')
+    
+    right = weather_df[['datetime', 'temperature', 'humidity']].dropna(subset=['datetime'])
+    right = right.assign(
+        datetime=right['datetime'].astype('datetime64[ns]'),
+        temperature=right['temperature'].astype('float64'),
+        humidity=right['humidity'].astype('float64')
+    ).sort_values('datetime')
+    
+    return pd.merge_asof(left, right, on='datetime', direction='nearest', tolerance=tolerance)
+
+def update_weather_data(page_size=WEATHER_PAGE_SIZE, batch_size=STAGING_BATCH_SIZE, account=None,
+                        latitude=DEFAULT_LATITUDE, longitude=DEFAULT_LONGITUDE, since=None):
     """
     Main function to:
-    1. Get rows with missing data from the database
-    2. Fetch weather data from Open-Meteo
-    3. Update the database with the fetched data
+    1. Walk one account's rows with missing data page by page, keyed on id
+    2. Fetch weather data from Open-Meteo at the account's location for each page
+    3. Bulk update the database through the configured storage backend
+    Runs until no rows with missing weather are left; with since, only rows after that datetime are considered
+    The account defaults to SRP_ACCOUNT
+    Returns the newest datetime that was given weather, or None; errors are raised to the caller
     """
-    try:
-        # Connect to the database
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_pass,
-            database=db_name
-        )
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Execute query to get rows with missing temperature or humidity
-        query = """
-        SELECT id, `date`, `hour`, datetime, temperature, humidity
-        FROM daniel1234.srp
-        WHERE temperature IS NULL OR humidity IS NULL
-        LIMIT 8000
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        if not rows:
-            print("No rows with missing weather data found.")
-            cursor.close()
-            conn.close()
-            return
-        
-        print(f"Found {len(rows)} rows with missing weather data.")
-        
-        # Get date range for weather API call
-        datetimes = [datetime.strptime(str(row['datetime']), '%Y-%m-%d %H:%M:%S') 
-                    for row in rows if row['datetime'] is not None]
-        
-        if not datetimes:
-            print("No valid datetimes found in the data.")
-            cursor.close()
-            conn.close()
-            return
-        
-        min_date = min(datetimes).date()
-        max_date = max(datetimes).date()
-        
-        # Add a buffer day on each side to ensure we have all hours
-        start_date = min_date - timedelta(days=1)
-        end_date = max_date + timedelta(days=1)
-        
-        print(f"Fetching weather data from {start_date} to {end_date}")
-        
-        # Scottsdale, Arizona coordinates
-        # You may want to make these configurable or fetch from your database
-        latitude = 33.7591
-        longitude = -111.7270
-        
-        # Fetch weather data
-        weather_df = fetch_weather_data(latitude, longitude, start_date, end_date)
-        
-        # Convert timezone if needed - depends on your data
-        # This assumes the database datetime is in the local timezone
-        weather_df['datetime'] = weather_df['datetime'].dt.tz_convert('America/Los_Angeles')
-        weather_df['datetime'] = weather_df['datetime'].dt.tz_localize(None)
-        
-        # Update database with weather data
-        update_cursor = conn.cursor()
+    account = srp_db.DEFAULT_ACCOUNT if account is None else account
+    with storage.open_storage() as store:
+        # Keyset pagination: each page starts after the last id seen, so rows
+        # that cannot be matched are skipped rather than re-read forever
+        last_id = 0
+        found_count = 0
         updated_count = 0
         skipped_count = 0
+        latest = None
+        started = time.monotonic()
         
-        for row in rows:
-            if row['datetime'] is None:
+        while True:
+            with metrics.timer('weather_select_page'):
+                rows = store.missing_weather_page(last_id, page_size, account, since)
+            
+            if not rows:
+                break
+            
+            last_id = rows[-1][0]
+            found_count += len(rows)
+            print(f"Found {len(rows)} rows with missing weather data (through id {last_id}).")
+            
+            # Load the page into a frame so matching and validation run on whole columns
+            rows_df = pd.DataFrame(rows, columns=['id', 'datetime'])
+            rows_df = rows_df.dropna(subset=['datetime'])
+            
+            if rows_df.empty:
+                print("No valid datetimes found in this page.")
+                skipped_count += len(rows)
                 continue
-                
-            # Find matching weather data
-            row_datetime = datetime.strptime(str(row['datetime']), '%Y-%m-%d %H:%M:%S')
             
-            # Find the closest timestamp in our weather data
-            closest_weather = weather_df.iloc[(weather_df['datetime'] - row_datetime).abs().argsort()[:1]]
+            rows_df['datetime'] = pd.to_datetime(rows_df['datetime'])
+            weather_df = fetch_local_weather(latitude, longitude,
+                                             rows_df['datetime'].min().date(),
+                                             rows_df['datetime'].max().date())
             
-            if not closest_weather.empty:
-                temperature_raw = closest_weather['temperature'].values[0]
-                humidity_raw = closest_weather['humidity'].values[0]
-                
-                # Check for NaN values and handle them
-                if pd.isna(temperature_raw) or pd.isna(humidity_raw):
-                    print(f"Warning: NaN values found for datetime {row_datetime}, skipping row {row['id']}")
-                    skipped_count += 1
-                    continue
-                
-                # Convert to float (this will raise an error if still NaN somehow)
-                try:
-                    temperature = float(temperature_raw)
-                    humidity = float(humidity_raw)
-                    
-                    # Additional validation - check if values are reasonable
-                    if np.isnan(temperature) or np.isnan(humidity):
-                        print(f"Warning: Invalid values (temp: {temperature}, humidity: {humidity}) for row {row['id']}, skipping")
-                        skipped_count += 1
-                        continue
-                        
-                except (ValueError, TypeError) as e:
-                    print(f"Warning: Could not convert values to float for row {row['id']}: {e}")
-                    skipped_count += 1
-                    continue
-                
-                # Update the database
-                update_query = """
-                UPDATE daniel1234.srp 
-                SET temperature = %s, humidity = %s
-                WHERE id = %s
-                """
-                update_cursor.execute(update_query, (temperature, humidity, row['id']))
-                updated_count += 1
-            else:
-                print(f"Warning: No weather data found for datetime {row_datetime}")
-                skipped_count += 1
-        
-        conn.commit()
-        print(f"Updated {updated_count} rows with weather data.")
-        print(f"Skipped {skipped_count} rows due to missing or invalid data.")
+            # Match every row to its nearest weather observation in one pass
+            matched_df = attach_weather(rows_df, weather_df)
+            valid_df = matched_df.dropna(subset=['temperature', 'humidity'])
+            skipped_count += len(rows) - len(valid_df)
+            
+            updates = list(zip(valid_df['id'].tolist(),
+                               valid_df['temperature'].tolist(),
+                               valid_df['humidity'].tolist()))
+            with metrics.timer('weather_apply_page', rows=len(updates)):
+                page_updated = store.apply_weather(updates, batch_size)
+            updated_count += page_updated
+            metrics.incr('weather_rows_updated', page_updated)
+            store.refresh_rollups(set(valid_df['datetime'].dt.date), account)
+            if not valid_df.empty:
+                page_latest = valid_df['datetime'].max().to_pydatetime()
+                latest = max(latest, page_latest) if latest else page_latest
+            metrics.incr('weather_rows_skipped', len(rows) - len(valid_df))
         
-        # Close cursor and connection
-        update_cursor.close()
-        cursor.close()
-        conn.close()
+        elapsed = time.monotonic() - started
         
-    except mysql.connector.Error as err:
-        print(f"Database Error: {err}")
-    except Exception as e:
-        print(f"Error: {e}")
+        if not found_count:
+            print("No rows with missing weather data found.")
+        else:
+            rate = updated_count / elapsed if elapsed > 0 else 0.0
+            print(f"Updated {updated_count} rows with weather data in {elapsed:.1f}s ({rate:.0f} rows/sec).")
+            print(f"Skipped {skipped_count} rows due to missing or invalid data.")
         
+        return latest
+
 if __name__ == "__main__":
-    update_weather_data()
+    # Configured here rather than on import, since the collectors import this module
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('srp_data_collection.log'),
+            logging.StreamHandler()
+        ]
+    )
+    try:
+        with metrics.timer('weather_update_total'):
+            update_weather_data()
+    except Exception:
+        logging.exception("Weather update failed")
+        sys.exit(1)
+    finally:
+        metrics.flush('weather')
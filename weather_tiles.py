@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+import numpy as np
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Weather is cached as one tile per (location, month) under TILE_DIR
+TILE_DIR = os.getenv('SRP_WEATHER_TILE_DIR', '.weather_tiles')
+
+# Total size the tile store may reach before least recently used tiles are evicted
+TILE_CACHE_MAX_BYTES = int(os.getenv('SRP_WEATHER_TILE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# The Open-Meteo archive trails real time by a few days; months that ended more
+# recently than this are fetched but not stored, so they are never cached incomplete
+ARCHIVE_DELAY_DAYS = 7
+
+_evict_lock = threading.Lock()
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return (month_start(day) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def months_between(start_date, end_date):
+    """List the first day of every month touching start_date..end_date"""
+    months = []
+    current = month_start(start_date)
+    while current <= end_date:
+        months.append(current)
+        current = month_end(current) + timedelta(days=1)
+    return months
+
+
+def is_cacheable(month, today=None):
+    """True once a month is old enough that the archive holds all of its hours"""
+    today = today or date.today()
+    return month_end(month) + timedelta(days=ARCHIVE_DELAY_DAYS) < today
+
+
+def tile_path(latitude, longitude, month, tile_dir=TILE_DIR):
+    # Coordinates are rounded so nearby float spellings of one site share tiles
+    return os.path.join(tile_dir, f"{latitude:.4f}_{longitude:.4f}_{month:%Y-%m}.npz")
+
+
+def load_tile(latitude, longitude, month, tile_dir=TILE_DIR):
+    """
+    Return (start_epoch, interval_seconds, values) for a cached tile, or None
+    values is a float32 array of shape (hours, 2): temperature, humidity
+    """
+    path = tile_path(latitude, longitude, month, tile_dir)
+    try:
+        with np.load(path) as tile:
+            result = int(tile['start']), int(tile['interval']), tile['values']
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+    # Refresh the modification time so eviction sees this tile as recently used
+    os.utime(path)
+    return result
+
+
+def save_tile(latitude, longitude, month, start, interval, values, tile_dir=TILE_DIR):
+    """Store one month of weather and evict old tiles if the store is over budget"""
+    os.makedirs(tile_dir, exist_ok=True)
+    path = tile_path(latitude, longitude, month, tile_dir)
+    tmp_path = path + f".{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, start=np.int64(start), interval=np.int64(interval), values=values.astype(np.float32))
+    os.replace(tmp_path, path)
+    evict(tile_dir)
+
+
+def evict(tile_dir=TILE_DIR, max_bytes=TILE_CACHE_MAX_BYTES):
+    """Delete least recently used tiles until the store fits in max_bytes"""
+    with _evict_lock:
+        tiles = []
+        for name in os.listdir(tile_dir):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(tile_dir, name))
+                tiles.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in tiles)
+        for _, size, name in sorted(tiles):
+            if total <= max_bytes:
+                break
+            os.remove(os.path.join(tile_dir, name))
+            total -= size